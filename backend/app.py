@@ -1,23 +1,71 @@
 
 from __future__ import annotations
 
+import asyncio
+import copyreg
+import functools
+from contextlib import asynccontextmanager
 from pathlib import Path
-from fastapi import FastAPI, WebSocket
+from typing import Callable
+from fastapi import FastAPI, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from loguru import logger
-from backend.engine.state import GameState
+from backend.engine.market import TICKS_PER_DAY
+from backend.engine.models import Order, Trade
+from backend.engine.state import STATE_FIELDS, GameState
 from fastapi.middleware.cors import CORSMiddleware
-import json
+import os
 import secrets
 from fastapi import Request, Response
-from backend.persist import init_db, load_state_json, save_state_json, delete_session
+from backend.persist import (
+    init_db,
+    load_session,
+    save_many,
+    delete_session,
+    close_db,
+    claim_db,
+    load_shared_market,
+    save_shared_market,
+    load_trade_history,
+    load_order_history,
+)
+from backend.engine.shared import SharedMarket
+from backend.cache import SessionCache, SessionConflict
+from backend.stream import StreamHub, Subscriber
+from backend.shard import ShardPool
+from backend import shard
+from backend.clock import TickScheduler
+from backend import fastjson
+from backend.fastjson import FastJSONResponse
 
 
 BASE_DIR = Path(__file__).resolve().parent
 FRONTEND_DIR = (BASE_DIR.parent / "frontend").resolve()
 
-app = FastAPI(title="Futures Sim Backend (调度券版)")
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    if pool is not None:
+        pool.start()
+    else:
+        claim_db(exclusive=sessions.durability != "sync")
+        sessions.start()
+    clock.start()
+    try:
+        yield
+    finally:
+        await clock.stop()
+        # 退出前把内存里的脏 session 全部写回（分片时由各 worker 退出前自己写）
+        if pool is not None:
+            await run_in_threadpool(pool.stop)
+        else:
+            sessions.stop()
+        _save_shared()
+        close_db()
+
+
+app = FastAPI(title="Futures Sim Backend (调度券版)", lifespan=_lifespan, default_response_class=FastJSONResponse)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -41,17 +89,140 @@ def _get_session_id(req: Request, resp: Response) -> str:
     return sid
 
 
+# 行情模式：private（默认）每个 session 各自一份行情；shared 全服共用一份，每个 tick 只模拟一次
+MARKET_MODE = os.environ.get("ENDFIELD_MARKET_MODE", "private")
+if MARKET_MODE not in ("private", "shared"):
+    raise ValueError(f"unknown market mode: {MARKET_MODE}")
+shared_market: SharedMarket | None = None
+if MARKET_MODE == "shared":
+    _d = load_shared_market()
+    shared_market = SharedMarket.from_dict(_d) if _d else SharedMarket()
+
+
+def _save_shared() -> None:
+    if shared_market is None or not shared_market.dirty:
+        return
+    d = shared_market.to_dict()
+    save_shared_market(d)
+    shared_market.dirty = False
+
+
 def _load_state(session_id: str) -> GameState:
-    raw = load_state_json(session_id)
-    if raw:
-        d = json.loads(raw)
-        return GameState.from_dict(d, frontend_dir=FRONTEND_DIR)
+    d = load_session(session_id)
+    if d:
+        return GameState.from_dict(d, frontend_dir=FRONTEND_DIR, shared=shared_market)
     # 新 session：新开一局（保留你的随机 specs）
-    return GameState(frontend_dir=FRONTEND_DIR)
+    return GameState(frontend_dir=FRONTEND_DIR, shared=shared_market)
+
+
+def _dump_state(gs: GameState) -> dict:
+    # 只取自上次落盘以来的改动，写库量跟改动大小走，不跟存档年龄走
+    return gs.to_delta()
+
+
+# 活跃 session 常驻内存，避免每个请求都 json.loads + from_dict / to_dict + json.dumps
+sessions = SessionCache.from_env(load=_load_state, dump=_dump_state, save_many=save_many)
+# /ws 订阅者；每次改状态后在 session 锁里 publish，推送增量
+hub = StreamHub()
+
+# 服务端时钟（ENDFIELD_TICK_INTERVAL > 0 时开启）：推进有 WS 订阅、或最近有请求的 session
+TICK_ACTIVE_WINDOW = float(os.environ.get("ENDFIELD_TICK_ACTIVE", "300"))
+
+
+def _tick_targets() -> list[str]:
+    sids = dict.fromkeys(hub.session_ids())
+    sids.update(dict.fromkeys(sessions.active(TICK_ACTIVE_WINDOW)))
+    return list(sids)
+
+
+def _advance_shared() -> None:
+    shared_market.advance()
+    # 共享行情按天落一次盘（进程退出时也会写）
+    if shared_market.tick % shared_market.ticks_per_day == 0:
+        _save_shared()
+
+
+def _tick_batch(sids: list[str]) -> None:
+    # sync 模式下整批一起等落盘，不逐个等
+    with sessions.batch():
+        for sid in sids:
+            # 有页面连着就保证在内存里；否则只推进还在缓存里的，不为了定时任务去读库
+            ctx = sessions.session(sid, write=True) if hub.has_subscribers(sid) else sessions.cached(sid, write=True)
+            with ctx as gs:
+                if gs is None:
+                    continue
+                gs.advance_tick()
+                hub.publish(sid, gs)
+
+
+# 读写 session 的操作都写成「session_id + 普通参数 -> 可 pickle 的结果」：
+# 单进程时在本进程线程池里跑，分片时按名字发给 session 所属的 worker 进程跑
+SHARD_OPS: dict[str, Callable] = {}
+# 改 session 的操作：(gs, session_id, *args)，在 session 锁里执行
+_MUTATIONS: dict[str, Callable] = {}
+
+
+def _op(fn: Callable) -> Callable:
+    SHARD_OPS[fn.__name__] = fn
+    return fn
+
+
+def _mutation(fn: Callable) -> Callable:
+    _MUTATIONS[fn.__name__] = fn
+    return fn
+
+
+# 多进程分片（ENDFIELD_SHARDS > 1）：本进程只做路由，session 的 GameState 都在 worker 进程里，
+# 每个 worker 导入的也是这个模块（ENDFIELD_SHARD_WORKER 已设置），用的是自己那份 sessions / hub
+SHARD_WORKER = os.environ.get("ENDFIELD_SHARD_WORKER")
+pool = None if SHARD_WORKER is not None else ShardPool.from_env("backend.app")
+if pool is not None and shared_market is not None:
+    # 共享行情是进程内的一份对象，分到多个进程就不再是同一份了
+    raise ValueError("ENDFIELD_SHARDS does not work with the shared market mode")
+if pool is not None and sessions.durability != "sync":
+    # 多个 worker 写同一个库：非 sync 下版本冲突时客户端已经拿到了 ok，改动只能丢掉（见 persist.claim_db）
+    raise ValueError("ENDFIELD_SHARDS requires ENDFIELD_DURABILITY=sync")
+
+# HTTPException 默认 pickle 回不来（__init__ 参数和 args 对不上）；worker 里抛的 400 / 404 要原样带回前端进程
+copyreg.pickle(HTTPException, lambda e: (HTTPException, (e.status_code, e.detail, e.headers)))
+
 
+def _tick_shards(names: list[str]) -> None:
+    # 各 worker 并行推进自己名下的活跃 session
+    pool.broadcast("_tick_active", shards=names)
 
-def _save_state(session_id: str, gs: GameState) -> None:
-    save_state_json(session_id, json.dumps(gs.to_dict(), ensure_ascii=False))
+
+@_op
+def _tick_active() -> int:
+    sids = _tick_targets()
+    _tick_batch(sids)
+    return len(sids)
+
+
+def shard_worker_start() -> None:
+    claim_db(exclusive=sessions.durability != "sync")
+    sessions.start()
+
+
+def shard_worker_stop() -> None:
+    sessions.stop()
+    close_db()
+
+
+if pool is not None:
+    clock = TickScheduler.from_env(targets=pool.names, step=_tick_shards)
+else:
+    clock = TickScheduler.from_env(
+        targets=_tick_targets,
+        step=_tick_batch,
+        prepare=_advance_shared if shared_market is not None else None,
+    )
+
+
+@app.exception_handler(SessionConflict)
+async def _on_conflict(req: Request, exc: SessionConflict) -> Response:
+    # 只有 sync 落盘会走到这里：这次修改没写进去，内存里那份也已作废，前端重新拉状态再操作即可
+    return FastJSONResponse({"detail": "session was modified by another worker, please retry"}, status_code=409)
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -59,65 +230,373 @@ def index() -> str:
     return (FRONTEND_DIR / "index.html").read_text(encoding="utf-8")
 
 
+# ETag 里带上进程启动标识：重启后版本号从头数，旧 ETag 不能误中
+_BOOT_ID = secrets.token_hex(4)
+
+
+def _etag(kind: str, *parts: object) -> str:
+    return '"' + "-".join([_BOOT_ID, kind, *map(str, parts)]) + '"'
+
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+def _state_etag(sid: str) -> str | None:
+    # 账户版本 + 共享行情 tick（共享模式下不写 session 行情也会动）
+    stamp = sessions.stamp(sid)
+    if stamp is None:
+        return None
+    if shared_market is not None:
+        return _etag("s", stamp[1], shared_market.tick)
+    return _etag("s", stamp[1])
+
+
+async def _run_op(sid: str, fn: Callable, *args: object):
+    if pool is not None:
+        return await pool.call(sid, fn.__name__, sid, *args)
+    return await run_in_threadpool(fn, sid, *args)
+
+
+# 写接口是协程：session 在内存里时直接在事件循环里改完、排进写队列就返回，不占线程池也不碰 SQLite
+async def _mutate(sid: str, fn: Callable, *args: object, inline: bool = True):
+    if pool is not None:
+        return await pool.call(sid, "_apply", fn.__name__, sid, *args)
+    return await sessions.call(sid, lambda gs: fn(gs, sid, *args), write=True, inline=inline)
+
+
+@_op
+def _apply(name: str, sid: str, *args: object):
+    with sessions.session(sid, write=True) as gs:
+        return _MUTATIONS[name](gs, sid, *args)
+
+
+@_op
+def _bootstrap_payload(sid: str, if_none_match: str | None) -> tuple[str | None, dict | None]:
+    # specs / 货品表在一局里不会变：同一个 GameState 对象就一直是同一个 ETag
+    stamp = sessions.stamp(sid)
+    if stamp is not None and _etag("b", stamp[0]) == if_none_match:
+        return if_none_match, None
+    # 只读；新开的局由缓存后台写回，不在这里写库
+    with sessions.session(sid) as gs:
+        payload = gs.bootstrap_payload()
+        etag = _etag("b", sessions.stamp(sid)[0])
+    return etag, payload
+
+
 @app.get("/api/bootstrap")
-def bootstrap(req: Request, resp: Response) -> dict:
+async def bootstrap(req: Request, resp: Response) -> dict:
     sid = _get_session_id(req, resp)
-    gs = _load_state(sid)
-    _save_state(sid, gs)  # 保险：第一次 bootstrap 时也落盘
-    return gs.bootstrap_payload()
+    etag, payload = await _run_op(sid, _bootstrap_payload, req.headers.get("if-none-match"))
+    if payload is None:
+        return _not_modified(etag)
+    # 前端据此决定是否还需要自己推进 / 轮询
+    payload["server_clock"] = clock.interval if clock.enabled else None
+    payload["market_mode"] = MARKET_MODE
+    resp.headers["ETag"] = etag
+    resp.headers["Cache-Control"] = "no-cache"
+    return payload
+
+
+@_op
+def _state_body(
+    sid: str,
+    if_none_match: str | None,
+    wanted: list[str] | None,
+    symbol: str | None,
+    since: int | None,
+    limit: int | None,
+    before: int | None,
+    months: str | None,
+) -> tuple[str | None, bytes | None]:
+    # 两次轮询之间没改过：直接 304，不碰 GameState 也不序列化
+    etag = _state_etag(sid)
+    if etag is not None and etag == if_none_match:
+        return etag, None
+    with sessions.session(sid) as gs:
+        if symbol is not None and symbol not in gs.market:
+            raise HTTPException(status_code=404, detail="unknown symbol")
+        picked = None
+        if months == "all":
+            picked = gs.contract_months
+        elif months is not None:
+            picked = [m for m in months.split(",") if m]
+            unknown = set(picked) - set(gs.contract_months)
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"unknown months: {','.join(sorted(unknown))}")
+        # 先取 ETag 再算内容：共享行情在这期间推进了，下次轮询只会多拿一次 200，不会误判 304
+        etag = _state_etag(sid)
+        payload = gs.state_payload(
+            fields=wanted,
+            symbol=symbol,
+            since=since,
+            limit=limit,
+            before=before,
+            fragment=fastjson.fragment if fastjson.available() else None,
+            months=picked,
+        )
+        # 编码放在锁里：片段和列表都还引用着 GameState 里的对象
+        body = fastjson.dumps(payload)
+    return etag, body
+
 
 @app.get("/api/state")
-def get_state(req: Request, resp: Response) -> dict:
+async def get_state(
+    req: Request,
+    resp: Response,
+    fields: str | None = None,
+    symbol: str | None = None,
+    since: int | None = Query(None, ge=0),
+    limit: int | None = Query(None, ge=1, le=1000),
+    before: int | None = Query(None, ge=1),
+    months: str | None = None,
+) -> Response:
+    # fields 逗号分隔，比如 ?fields=account,market&symbol=AKT2603；months=2604,2606 或 all 取非主力月
+    wanted = None
+    if fields is not None:
+        wanted = [f for f in fields.split(",") if f]
+        unknown = set(wanted) - set(STATE_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"unknown fields: {','.join(sorted(unknown))}")
     sid = _get_session_id(req, resp)
-    gs = _load_state(sid)
-    return gs.state_payload()
+    etag, body = await _run_op(
+        sid, _state_body, req.headers.get("if-none-match"), wanted, symbol, since, limit, before, months
+    )
+    if body is None:
+        return _not_modified(etag)
+    # 直接返回编码好的响应，跳过 jsonable_encoder（它不认识预编码片段）
+    out = Response(content=body, media_type="application/json", headers={"ETag": etag, "Cache-Control": "no-cache"})
+    # 新 session 的 cookie 是设在注入的 resp 上的，手动带过来
+    out.raw_headers.extend(h for h in resp.raw_headers if h[0] == b"set-cookie")
+    return out
 
-@app.post("/api/tick")
-def tick(req: Request, resp: Response) -> dict:
+
+@_op
+def _history_page(sid: str, kind: str, before: int | None, limit: int) -> dict:
+    with sessions.session(sid) as gs:
+        page = gs.state_payload(fields=[kind], limit=limit, before=before)
+        if kind == "trades":
+            info = page["trades_page"]
+            # 内存窗口不够 limit 条，剩下的从归档补（归档里的序号都 < 内存窗口起点）
+            need = limit - len(page["trades"])
+            start = info["from"] - 1
+            db_before = start if before is None else min(start, before - 1)
+        else:
+            floor = gs._orders_floor
+            # 内存里还有的（未成交的，和压在下限以下、后来才结束的）以内存为准，库里的不再取
+            live = [o.order_id for o in gs.orders if o.order_id < floor]
+            total = page["orders_page"]["total"]
+
+    if kind == "trades":
+        rows = load_trade_history(sid, db_before, need) if need > 0 and db_before > 0 else []
+        older = [gs._trade_payload(Trade(**d)) for _, d in rows]
+        first = rows[0][0] + 1 if rows else info["from"]
+        return {"trades": older + page["trades"], "from": first, "total": info["total"]}
+
+    # 委托不连续（早的未成交委托还在内存里）：两边各取 limit 条，合并后取最后 limit 条
+    older = []
+    cut = floor if before is None else min(before, floor)
+    if cut > 0:
+        older = [gs._order_payload(Order(**d)) for d in load_order_history(sid, cut, limit, exclude=live)]
+    # 按 order_id 去重，内存里的覆盖库里的（库里可能还是更早落盘时的状态）
+    merged = {o["id"]: o for o in older}
+    merged.update((o["id"], o) for o in page["orders"])
+    orders = sorted(merged.values(), key=lambda o: o["id"])[-limit:]
+    return {"orders": orders, "total": total}
+
+
+@app.get("/api/history")
+async def get_history(
+    req: Request,
+    resp: Response,
+    kind: str = Query("trades", pattern="^(trades|orders)$"),
+    before: int | None = Query(None, ge=1),
+    limit: int = Query(50, ge=1, le=500),
+) -> dict:
+    """翻历史成交 / 委托：内存窗口里的直接取，更早的查归档表。
+
+    trades 的 before 是成交序号（从 1 开始），orders 的 before 是 order_id；取 before 之前的最后 limit 条。
+    """
     sid = _get_session_id(req, resp)
-    gs = _load_state(sid)
+    return await _run_op(sid, _history_page, kind, before, limit)
+
+
+# 一次请求最多快进多少个 tick（TICKS_PER_DAY = 20 时就是 100 天）
+BULK_TICKS_MAX = 2000
+
+
+@_mutation
+def _advance_one(gs: GameState, sid: str) -> None:
     gs.advance_tick()
-    _save_state(sid, gs)
+    hub.publish(sid, gs)
+
+
+@_mutation
+def _advance_n(gs: GameState, sid: str, n: int) -> dict:
+    # 内存里连续推进，最后只推送一次、落盘一次
+    summary = gs.advance_ticks(n)
+    hub.publish(sid, gs)
+    return summary
+
+
+@_mutation
+def _advance_days(gs: GameState, sid: str, days: int) -> dict:
+    # 推进到第 days 个收盘：今天剩下的 tick + 之后的整天
+    return _advance_n(gs, sid, days * gs.ticks_per_day - gs.tick % gs.ticks_per_day)
+
+
+@app.post("/api/tick")
+async def tick(req: Request, resp: Response, n: int = Query(1, ge=1, le=BULK_TICKS_MAX)) -> dict:
+    sid = _get_session_id(req, resp)
+    if n > 1:
+        return await _fast_forward(sid, _advance_n, n)
+    if shared_market is not None and not clock.enabled:
+        # 共享行情又没开服务端时钟：谁点「下一 Tick」就替全服推进一轮，再推给其他连着的页面
+        await run_in_threadpool(_advance_shared)
+        others = [s for s in hub.session_ids() if s != sid]
+        await run_in_threadpool(_tick_batch, others)
+    await _mutate(sid, _advance_one)
     return {"ok": True}
 
-@app.post("/api/reset_all")
-def reset_all(req: Request, resp: Response) -> dict:
+
+@app.post("/api/advance_day")
+async def advance_day(req: Request, resp: Response, days: int = Query(1, ge=1, le=BULK_TICKS_MAX // TICKS_PER_DAY)) -> dict:
     sid = _get_session_id(req, resp)
+    return await _fast_forward(sid, _advance_days, days)
+
+
+async def _fast_forward(sid: str, fn: Callable, arg: int) -> dict:
+    if shared_market is not None:
+        # 共享行情是全服一份，不能替一个人快进
+        raise HTTPException(status_code=409, detail="fast-forward is not available in shared market mode")
+    summary = await _mutate(sid, fn, arg, inline=False)
+    return {"ok": True, **summary}
+
+
+@_op
+def _reset(sid: str) -> None:
+    sessions.drop(sid)
     delete_session(sid)  # 直接删档，下次 load 会生成新局
+    if hub.has_subscribers(sid):
+        # 有连着的页面就立刻开新局，让它们收到新局的 snapshot
+        with sessions.session(sid, write=True) as gs:
+            hub.publish(sid, gs)
+
+
+@app.post("/api/reset_all")
+async def reset_all(req: Request, resp: Response) -> dict:
+    sid = _get_session_id(req, resp)
+    await _run_op(sid, _reset)
     return {"ok": True}
 
+
+@_mutation
+def _place(gs: GameState, sid: str, payload: dict) -> dict:
+    result = gs.place_order(payload)
+    hub.publish(sid, gs)
+    return result
+
+
 @app.post("/api/orders")
-def place_order(payload: dict, req: Request, resp: Response) -> dict:
+async def place_order(payload: dict, req: Request, resp: Response) -> dict:
     sid = _get_session_id(req, resp)
-    gs = _load_state(sid)
-    out = gs.place_order(payload)
-    _save_state(sid, gs)
-    return out
+    return await _mutate(sid, _place, payload)
+
 
+@_mutation
+def _cancel_all(gs: GameState, sid: str) -> None:
+    gs.cancel_all()
+    hub.publish(sid, gs)
 
 
 @app.post("/api/cancel_all")
-def cancel_all(req: Request, resp: Response) -> dict:
+async def cancel_all(req: Request, resp: Response) -> dict:
     sid = _get_session_id(req, resp)
-    gs = _load_state(sid)
+    await _mutate(sid, _cancel_all)
+    return {"ok": True}
 
-    gs.cancel_all()
 
-    _save_state(sid, gs)
-    return {"ok": True}
+@_mutation
+def _close(gs: GameState, sid: str, payload: dict) -> None:
+    gs.close_position(payload)
+    hub.publish(sid, gs)
 
 
 @app.post("/api/close")
-def close_position(payload: dict, req: Request, resp: Response) -> dict:
+async def close_position(payload: dict, req: Request, resp: Response) -> dict:
     sid = _get_session_id(req, resp)
-    gs = _load_state(sid)
+    await _mutate(sid, _close, payload)
+    return {"ok": True}
 
-    gs.close_position(payload)
 
-    _save_state(sid, gs)
-    return {"ok": True}
+# 分片 worker 里代前端进程挂的订阅者：token -> Subscriber，推送经 Pipe 转回前端进程
+_remote_subs: dict[int, Subscriber] = {}
+
+
+@_op
+def _ws_attach(sid: str, token: int) -> None:
+    _remote_subs[token] = hub.subscribe(sid, forward=functools.partial(shard.push, token))
+    _ws_resync(sid, token)
+
+
+@_op
+def _ws_resync(sid: str, token: int) -> None:
+    sub = _remote_subs.get(token)
+    if sub is None:
+        return
+    with sessions.session(sid) as gs:
+        hub.resync(sub, gs)
+
+
+@_op
+def _ws_detach(sid: str, token: int) -> None:
+    sub = _remote_subs.pop(token, None)
+    if sub is not None:
+        hub.unsubscribe(sub)
+
 
-'''
 @app.websocket("/ws")
-    #TODO:websocket
-'''
\ No newline at end of file
+async def ws_stream(ws: WebSocket) -> None:
+    # 和 HTTP 接口共用 session_id cookie；没有 cookie 说明页面还没 bootstrap
+    sid = ws.cookies.get("session_id")
+    if not (sid and len(sid) >= 16):
+        await ws.close(code=1008)
+        return
+    await ws.accept()
+    sub = hub.subscribe(sid)
+    token = None
+
+    def _resync() -> None:
+        with sessions.session(sid) as gs:
+            hub.resync(sub, gs)
+
+    async def _send() -> None:
+        while True:
+            # 和 HTTP 一样走 fastjson：inf 维持率编码成 null（标准库会写出 JS 解析不了的 Infinity）
+            await ws.send_text(fastjson.dumps(await sub.queue.get()).decode("utf-8"))
+
+    sender = asyncio.create_task(_send())
+    try:
+        if pool is not None:
+            # GameState 在 worker 里：那边挂一个转发订阅者，消息经 Pipe 回到这里的 sub.queue
+            token = pool.subscribe(sub.deliver)
+            await pool.call(sid, "_ws_attach", sid, token)
+        else:
+            await run_in_threadpool(_resync)
+        while True:
+            msg = await ws.receive_json()
+            # 前端发现 seq 断号时请求重新拿一次全量
+            if isinstance(msg, dict) and msg.get("type") == "resync":
+                if pool is not None:
+                    await pool.call(sid, "_ws_resync", sid, token)
+                else:
+                    await run_in_threadpool(_resync)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        hub.unsubscribe(sub)
+        if token is not None:
+            pool.unsubscribe(token)
+            # 不等回包：连接已经断了，worker 那边顺手摘掉就行
+            pool.submit(pool.shard_of(sid), "_ws_detach", sid, token)
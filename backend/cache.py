@@ -0,0 +1,404 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Iterator, TypeVar
+
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+
+from backend.engine.state import GameState
+from backend.writer import WriteQueue
+
+# 落盘策略（控制最多可能丢多少数据）：
+#   sync     每次修改后立刻写库，进程崩溃也不丢
+#   interval 后台线程每 flush_interval 秒批量写一次，最多丢这一段时间
+#   evict    只在淘汰 / 进程退出时写，最快但崩溃会丢掉内存里的全部改动
+DURABILITY_MODES = ("sync", "interval", "evict")
+
+# 进程内全局递增的版本号：每次写都取一个新值，session 被淘汰后重新加载也不会和旧版本撞号
+_versions = itertools.count(1)
+
+T = TypeVar("T")
+
+
+class SessionConflict(RuntimeError):
+    """写库时发现库里的版本比内存里的新（别的进程写过这个 session）：这份内存状态作废，没有写进去。"""
+
+
+@dataclass
+class _Entry:
+    state: GameState
+    lock: threading.RLock = field(default_factory=threading.RLock)
+    dirty: bool = False
+    last_used: float = field(default_factory=time.monotonic)
+    # born：放进缓存时的版本（换了 GameState 对象就变）；version：每次写之后递增
+    born: int = field(default_factory=lambda: next(_versions))
+    version: int = 0
+
+    def __post_init__(self) -> None:
+        self.version = self.born
+
+
+class SessionCache:
+    """进程内的 GameState LRU 缓存，脏 session 交给单写线程（WriteQueue）批量写回 SQLite。
+
+    请求线程 / 事件循环只改内存、把 session 排进写队列，不直接碰 SQLite；
+    sync 模式下等的是写队列的 Future（在 session 锁外等），不是自己去写。
+    """
+
+    def __init__(
+        self,
+        load: Callable[[str], GameState],
+        dump: Callable[[GameState], dict],
+        save_many: Callable[[list[tuple[str, dict]]], list[str]],
+        max_size: int = 256,
+        idle_ttl: float = 1800.0,
+        flush_interval: float = 1.0,
+        durability: str = "interval",
+    ) -> None:
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"unknown durability mode: {durability}")
+        self._load = load
+        self._dump = dump
+        self._save_many = save_many
+        self.max_size = max(1, max_size)
+        self.idle_ttl = idle_ttl
+        self.flush_interval = flush_interval
+        self.durability = durability
+
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._writer: WriteQueue[_Entry] = WriteQueue(self._write)
+        self._local = threading.local()
+        # 协程排队用的 per-session asyncio.Lock（只在事件循环线程里用）：[锁, 排队数]
+        self._queues: dict[str, list] = {}
+
+    @classmethod
+    def from_env(
+        cls,
+        load: Callable[[str], GameState],
+        dump: Callable[[GameState], dict],
+        save_many: Callable[[list[tuple[str, dict]]], list[str]],
+    ) -> "SessionCache":
+        return cls(
+            load=load,
+            dump=dump,
+            save_many=save_many,
+            max_size=int(os.environ.get("ENDFIELD_CACHE_SIZE", "256")),
+            idle_ttl=float(os.environ.get("ENDFIELD_CACHE_TTL", "1800")),
+            flush_interval=float(os.environ.get("ENDFIELD_FLUSH_INTERVAL", "1.0")),
+            durability=os.environ.get("ENDFIELD_DURABILITY", "interval"),
+        )
+
+    # --------- Access ----------
+    @contextmanager
+    def session(self, session_id: str, write: bool = False) -> Iterator[GameState]:
+        entry = self._get_entry(session_id)
+        with entry.lock:
+            yield entry.state
+            write = self._settle(entry, write)
+        if write:
+            self._persist(session_id, entry)
+
+    @contextmanager
+    def cached(self, session_id: str, write: bool = False) -> Iterator[GameState | None]:
+        """只取已经在内存里的 session：不读库、不刷新最近使用时间（给后台定时任务用）。"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+        if entry is None:
+            yield None
+            return
+        with entry.lock:
+            yield entry.state
+            write = self._settle(entry, write)
+        if write:
+            self._persist(session_id, entry)
+
+    async def call(
+        self, session_id: str, fn: Callable[[GameState], T], write: bool = False, inline: bool = True
+    ) -> T:
+        """协程版 session()：返回 fn(state)。
+
+        session 在内存里且锁空闲时直接在事件循环里跑 fn（fn 只能做内存操作）；
+        要读库或者锁被别的线程占着时才放进线程池。fn 本身很重（比如快进几百个 tick）时传 inline=False，
+        总是放进线程池。sync 模式下用 await 等落盘，不占线程。
+        同一个 session 的并发请求先在 asyncio 锁上排队，不会各占一个线程去等 session 锁。
+        """
+        async with self._queue(session_id):
+            entry = self._hit(session_id) if inline else None
+            if entry is not None and entry.lock.acquire(blocking=False):
+                try:
+                    result = fn(entry.state)
+                    write = self._settle(entry, write)
+                finally:
+                    entry.lock.release()
+            else:
+                entry, result, write = await run_in_threadpool(self._call_locked, session_id, fn, write)
+        if write and self.durability == "sync":
+            await asyncio.wrap_future(self._submit(session_id, entry))
+        return result
+
+    @asynccontextmanager
+    async def _queue(self, session_id: str) -> AsyncIterator[None]:
+        slot = self._queues.get(session_id)
+        if slot is None:
+            slot = self._queues[session_id] = [asyncio.Lock(), 0]
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0:
+                del self._queues[session_id]
+
+    def _call_locked(
+        self, session_id: str, fn: Callable[[GameState], T], write: bool
+    ) -> tuple[_Entry, T, bool]:
+        entry = self._get_entry(session_id)
+        with entry.lock:
+            result = fn(entry.state)
+            write = self._settle(entry, write)
+        return entry, result, write
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """一次改一批 session 时包在外面：sync 模式下最后一起等落盘（写线程合成一个事务），不逐个等。"""
+        if getattr(self._local, "waits", None) is not None:
+            yield
+            return
+        self._local.waits = waits = []
+        try:
+            yield
+        finally:
+            self._local.waits = None
+        for fut in waits:
+            try:
+                fut.result()
+            except SessionConflict:
+                # 批量推进的是别人的 session：冲突的那份已经作废并记了日志，其余照常
+                pass
+
+    def _settle(self, entry: _Entry, write: bool) -> bool:
+        # 调用方持有 entry.lock。只读访问在共享行情下也可能追过行情、改了账户：一样标脏、落盘，
+        # 否则淘汰后重新读档会按旧档再撮合一遍。返回这次访问最终算不算写
+        if entry.state.pop_caught_up():
+            write = True
+        if write:
+            self._mark(entry)
+        return write
+
+    def _mark(self, entry: _Entry) -> None:
+        # 调用方持有 entry.lock
+        entry.dirty = True
+        entry.version = next(_versions)
+
+    def _persist(self, session_id: str, entry: _Entry) -> None:
+        # 在 session 锁外调用：写线程 dump 时要拿这把锁
+        if self.durability != "sync":
+            return
+        fut = self._submit(session_id, entry)
+        waits = getattr(self._local, "waits", None)
+        if waits is None:
+            fut.result()
+        else:
+            waits.append(fut)
+
+    def _submit(self, session_id: str, entry: _Entry) -> Future:
+        if self._writer.running:
+            return self._writer.submit(session_id, entry)
+        # 写线程没启动（脚本里直接用缓存）：就地写
+        fut: Future = Future()
+        try:
+            exc = self._write([(session_id, entry)]).get(session_id)
+        except Exception as e:
+            exc = e
+        if exc is None:
+            fut.set_result(None)
+        else:
+            fut.set_exception(exc)
+        return fut
+
+    def stamp(self, session_id: str) -> tuple[int, int] | None:
+        """(born, version)；session 不在内存里时返回 None。只看一眼，不加载、不加锁。
+
+        在 session() 里面调用时拿到的就是当前这份状态的版本（写操作要等锁）。
+        """
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        return entry.born, entry.version
+
+    def active(self, within: float) -> list[str]:
+        """最近 within 秒内被请求访问过的 session（按最近使用从旧到新）。"""
+        deadline = time.monotonic() - within
+        with self._lock:
+            return [sid for sid, e in self._entries.items() if e.last_used > deadline]
+
+    def drop(self, session_id: str) -> None:
+        # 不写回：用于删档。排队中的写也一起丢掉，免得删完又被写回来
+        with self._lock:
+            self._entries.pop(session_id, None)
+        self._writer.discard(session_id)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _hit(self, session_id: str) -> _Entry | None:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                self._entries.move_to_end(session_id)
+                entry.last_used = time.monotonic()
+            return entry
+
+    def _get_entry(self, session_id: str) -> _Entry:
+        entry = self._hit(session_id)
+        if entry is not None:
+            return entry
+
+        # 刚被淘汰、还在写队列里没落盘的：直接拿回来，库里那份是旧的
+        entry = self._writer.peek(session_id)
+        if entry is None:
+            # 读库放在全局锁外面，避免一个慢 session 卡住所有人
+            state = self._load(session_id)
+
+        with self._lock:
+            cur = self._entries.get(session_id)
+            if cur is not None:
+                # 并发 miss：以先放进来的为准
+                self._entries.move_to_end(session_id)
+                entry = cur
+            elif entry is not None:
+                self._entries[session_id] = entry
+            else:
+                # 新开的局 / 旧版整包存档还没按行落过盘：交给写线程，不在请求里同步写
+                entry = _Entry(state=state, dirty=state._full_rewrite)
+                self._entries[session_id] = entry
+            entry.last_used = time.monotonic()
+            evicted = self._pop_overflow()
+
+        self._evict(evicted)
+        return entry
+
+    # --------- Eviction / flushing ----------
+    def _pop_overflow(self) -> list[tuple[str, _Entry]]:
+        evicted = []
+        while len(self._entries) > self.max_size:
+            evicted.append(self._entries.popitem(last=False))
+        return evicted
+
+    def _pop_idle(self) -> list[tuple[str, _Entry]]:
+        if self.idle_ttl <= 0:
+            return []
+        deadline = time.monotonic() - self.idle_ttl
+        evicted = []
+        with self._lock:
+            # OrderedDict 按最近使用排序，遇到第一个没过期的就可以停
+            for sid, entry in list(self._entries.items()):
+                if entry.last_used > deadline:
+                    break
+                evicted.append((sid, self._entries.pop(sid)))
+        return evicted
+
+    def _write(self, entries: list[tuple[str, _Entry]]) -> dict[str, Exception]:
+        """序列化时持有各自的 session 锁，写库时不持有；多个 session 一个事务提交。
+
+        返回版本冲突没写进去的 session；这些 session 从缓存里拿掉，下次访问从库里读最新的。
+        """
+        batch = []
+        for sid, entry in entries:
+            with entry.lock:
+                if not entry.dirty:
+                    continue
+                batch.append((sid, entry, self._dump(entry.state)))
+                entry.dirty = False
+        if not batch:
+            return {}
+        try:
+            conflicts = set(self._save_many([(sid, raw) for sid, _, raw in batch]))
+        except Exception:
+            # 写失败就留着下次再试；增量已经取走了，下次只能整体重写
+            for _, entry, _ in batch:
+                with entry.lock:
+                    entry.state.mark_full_rewrite()
+                    entry.dirty = True
+            logger.exception("flush {} sessions failed", len(batch))
+            raise
+        failed: dict[str, Exception] = {}
+        for sid, entry, raw in batch:
+            if sid not in conflicts:
+                with entry.lock:
+                    entry.state.mark_saved(raw)
+                continue
+            # 别的进程写过：丢掉这份内存状态（包括还没写进去的改动），不覆盖对方
+            with self._lock:
+                if self._entries.get(sid) is entry:
+                    del self._entries[sid]
+            logger.warning("session {} changed in the database since it was loaded, dropped stale copy", sid)
+            failed[sid] = SessionConflict(sid)
+        return failed
+
+    def _evict(self, entries: list[tuple[str, _Entry]]) -> None:
+        # 淘汰的 session 交给写线程；写完之前再被访问会从写队列里拿回来（见 _get_entry）
+        if not entries:
+            return
+        if not self._writer.running:
+            self._write(entries)
+            return
+        for sid, entry in entries:
+            self._writer.submit(sid, entry)
+
+    def flush(self) -> int:
+        """把所有脏 session 排进写队列并等它们落盘，返回这次提交的 session 数。"""
+        with self._lock:
+            dirty = [(sid, e) for sid, e in self._entries.items() if e.dirty]
+        if not self._writer.running:
+            self._write(dirty)
+            return len(dirty)
+        for fut in [self._writer.submit(sid, e) for sid, e in dirty]:
+            try:
+                fut.result()
+            except SessionConflict:
+                # 已经从缓存里拿掉并记了日志，不影响其它 session
+                pass
+        return len(dirty)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self._evict(self._pop_idle())
+                if self.durability == "interval":
+                    self.flush()
+            except Exception:
+                # 已经记过日志，脏标记也还在，下一轮再试
+                pass
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._writer.start()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="session-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            self.flush()
+        finally:
+            # 写线程把队列里剩下的（包括刚淘汰的）写完再退出
+            self._writer.stop()
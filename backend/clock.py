@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import Callable
+
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+
+# 服务端时钟：行情按固定节奏推进，不再依赖浏览器 POST /api/tick。
+# 每个 tick 先拿到这一轮要推进的 session，再按 batch_size 分批丢进线程池，
+# 一批一次线程切换，批与批之间让出事件循环，HTTP / WS 请求不会被整轮 tick 卡住。
+
+
+class TickScheduler:
+    def __init__(
+        self,
+        targets: Callable[[], list[str]],
+        step: Callable[[list[str]], None],
+        interval: float,
+        batch_size: int = 64,
+        prepare: Callable[[], None] | None = None,
+    ) -> None:
+        self._targets = targets
+        self._step = step
+        # 每个 tick 开头跑一次（共享行情模式：全服行情只在这里推进一次）
+        self._prepare = prepare
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self._task: asyncio.Task | None = None
+
+    @classmethod
+    def from_env(
+        cls,
+        targets: Callable[[], list[str]],
+        step: Callable[[list[str]], None],
+        prepare: Callable[[], None] | None = None,
+    ) -> "TickScheduler":
+        return cls(
+            targets=targets,
+            step=step,
+            prepare=prepare,
+            interval=float(os.environ.get("ENDFIELD_TICK_INTERVAL", "0")),
+            batch_size=int(os.environ.get("ENDFIELD_TICK_BATCH", "64")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    async def tick_once(self) -> int:
+        if self._prepare is not None:
+            await run_in_threadpool(self._prepare)
+        sids = self._targets()
+        for i in range(0, len(sids), self.batch_size):
+            await run_in_threadpool(self._step, sids[i : i + self.batch_size])
+        return len(sids)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_at = loop.time() + self.interval
+        while True:
+            await asyncio.sleep(max(0.0, next_at - loop.time()))
+            try:
+                await self.tick_once()
+            except Exception:
+                logger.exception("scheduled tick failed")
+            next_at += self.interval
+            now = loop.time()
+            if next_at < now:
+                # 一轮跑得比间隔还久：跳过错过的 tick，不补跑，避免越积越多
+                skipped = int((now - next_at) // self.interval) + 1
+                logger.warning("tick took longer than {}s, skipped {} tick(s)", self.interval, skipped)
+                next_at += skipped * self.interval
+
+    def start(self) -> None:
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import json
+import os
+import struct
+import zlib
+from array import array
+from itertools import accumulate
+
+# 二进制存档格式：
+#   b"EF" + version(1B) + flags(1B) + body
+#   v2：body = JSON 文本（flags & ZLIB 时整体 zlib 压缩）
+#   v1：body = json_len(u32) + json + 数组区，长的 float 列表打包进数组区，JSON 里留 {"__a__": meta} 占位。
+#       打包要把整棵树走一遍，比直接 json.dumps 还慢，解码也不比 json.loads 快，压缩后只省两成体积；
+#       占位键还会和用户数据撞上。v2 不再打包，v1 只保留解码，读旧存档用。
+# 旧存档是纯 JSON 文本，decode 会自动识别，不需要迁移脚本。
+MAGIC = b"EF"
+VERSION = 2
+FLAG_ZLIB = 0x01
+
+_HEADER = struct.Struct("<2sBB")
+_U32 = struct.Struct("<I")
+_MIN_COMPRESS = 256
+
+_V1_ARRAY_KEY = "__a__"
+_V1_CODES = {"b", "h", "i", "d"}
+
+_level = int(os.environ.get("ENDFIELD_CODEC_ZLIB", "1"))
+
+
+def encode(obj: object, level: int | None = None) -> bytes:
+    body = json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    level = _level if level is None else level
+    flags = 0
+    if level > 0 and len(body) >= _MIN_COMPRESS:
+        body = zlib.compress(body, level)
+        flags |= FLAG_ZLIB
+    return _HEADER.pack(MAGIC, VERSION, flags) + body
+
+
+def _unpack_v1_floats(meta: object, blob: memoryview) -> list[float] | None:
+    # 形状不对 / 越界的占位（多半是用户数据里本来就有的 "__a__" 键）原样留着，不当数组解
+    if not (isinstance(meta, list) and len(meta) == 4 and meta[0] in _V1_CODES):
+        return None
+    code, first, offset, count = meta
+    if not (isinstance(first, int) and isinstance(offset, int) and isinstance(count, int)):
+        return None
+    arr = array(code)
+    n = count if code == "d" else count - 1
+    end = offset + arr.itemsize * n
+    if offset < 0 or n < 0 or end > len(blob):
+        return None
+    arr.frombytes(blob[offset:end])
+    if code == "d":
+        return arr.tolist()
+    return list(map(float, accumulate(arr, initial=first)))
+
+
+def _decode_v1(body: bytes) -> object:
+    (n,) = _U32.unpack_from(body)
+    text = body[_U32.size : _U32.size + n]
+    blob = memoryview(body)[_U32.size + n :]
+
+    def hook(d: dict) -> object:
+        if len(d) == 1 and _V1_ARRAY_KEY in d:
+            values = _unpack_v1_floats(d[_V1_ARRAY_KEY], blob)
+            if values is not None:
+                return values
+        return d
+
+    return json.loads(text, object_hook=hook)
+
+
+def decode(raw: bytes | str) -> object:
+    # 旧版存档：TEXT 列里的 JSON
+    if isinstance(raw, str):
+        return json.loads(raw)
+    if not raw.startswith(MAGIC):
+        return json.loads(raw.decode("utf-8"))
+
+    _, version, flags = _HEADER.unpack_from(raw)
+    if version not in (1, VERSION):
+        raise ValueError(f"unsupported snapshot codec version: {version}")
+    body = raw[_HEADER.size :]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    if version == 1:
+        return _decode_v1(body)
+    return json.loads(body)
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from pathlib import Path
+
+# 货品 / 合约月份是所有 session 共用的只读参考数据：进程里只有一份，
+# 存档里只记 catalog 版本号。改动货品表时请新增一个版本，不要原地修改旧版本。
+CATALOG_VERSION = 1
+
+
+@dataclass(frozen=True)
+class Catalog:
+    version: int | None
+    products: tuple[dict, ...]
+    contract_months: tuple[str, ...]
+    _bootstrap: dict[Path, list[dict]] = field(default_factory=dict, compare=False, repr=False)
+
+    def main_contract(self, code: str) -> str:
+        return f"{code}{self.contract_months[0]}"
+
+    def symbols(self) -> list[str]:
+        return [f"{p['code']}{ym}" for p in self.products for ym in self.contract_months]
+
+    def curves(self, main_only: bool = False) -> list[list[str]]:
+        # 按货品分组的全部合约（近月在前），行情按组联动推进；main_only 时每组只有主力月
+        months = self.contract_months[:1] if main_only else self.contract_months
+        return [[f"{p['code']}{ym}" for ym in months] for p in self.products]
+
+    def bootstrap_products(self, frontend_dir: Path) -> list[dict]:
+        # 素材是否存在只在第一次用到时查一次文件系统
+        cached = self._bootstrap.get(frontend_dir)
+        if cached is None:
+            cached = []
+            for p in self.products:
+                code = p["code"]
+                asset = frontend_dir / "assets" / f"{code}.png"
+                cached.append(
+                    {
+                        "code": code,
+                        "name": p["name"],
+                        "asset_file": f"/assets/{code}.png" if asset.exists() else None,
+                        "main_contract": self.main_contract(code),
+                    }
+                )
+            self._bootstrap[frontend_dir] = cached
+        return cached
+
+
+_CATALOGS: dict[int, Catalog] = {
+    1: Catalog(
+        version=1,
+        products=(
+            {"code": "AKT", "name": "锚点厨具"},
+            {"code": "SKB", "name": "悬空骸骨骨雕"},
+            {"code": "WMD", "name": "巫术矿钻"},
+            {"code": "ANG", "name": "天使罐头"},
+            {"code": "HYR", "name": "谷地水培肉"},
+            {"code": "TUJ", "name": "团结牌口服液"},
+            {"code": "SEK", "name": "塞什卡牌石"},
+            {"code": "YSM", "name": "源石树幼苗"},
+            {"code": "JJD", "name": "警戒者矿锭"},
+            {"code": "XTK", "name": "星体晶块"},
+            {"code": "JMB", "name": "边角料积木"},
+            {"code": "HNK", "name": "硬脑壳头盔"},
+        ),
+        contract_months=("2603", "2604", "2606"),
+    ),
+}
+
+
+def get_catalog(version: int = CATALOG_VERSION) -> Catalog:
+    try:
+        return _CATALOGS[version]
+    except KeyError:
+        raise ValueError(f"unknown catalog version: {version}") from None
+
+
+def catalog_for(products: list[dict], contract_months: list[str]) -> Catalog:
+    """旧存档里内嵌了完整的货品表：和已知版本一致就复用共享的那份。"""
+    products_t = tuple(dict(p) for p in products)
+    months_t = tuple(contract_months)
+    for c in _CATALOGS.values():
+        if c.products == products_t and c.contract_months == months_t:
+            return c
+    # 对不上任何版本：单独保留一份，落盘时继续内嵌
+    return Catalog(version=None, products=products_t, contract_months=months_t)
@@ -1,7 +1,11 @@
 from __future__ import annotations
 import math
+import os
 import random
+import secrets
+from functools import lru_cache
 from time import strftime
+from typing import Callable, Iterable
 
 from backend.engine.models import Market, Spec
 
@@ -20,12 +24,39 @@ def now_str() -> str:
     return strftime("%H:%M:%S")
 
 
-def init_market(symbol: str, code: str, spec: Spec) -> Market:
+# 下面的随机函数都可以传入一个 random.Random（每个 session 自己的随机流，见 GameState._rng），
+# 不传时用全局 random 模块（基准脚本里直接用）
+
+
+def new_seed() -> int:
+    # 新局的随机种子；想复现某一局就把同一个种子传给 GameState(seed=...)
+    return secrets.randbits(63)
+
+
+def random_spec(rng: random.Random | None = None) -> Spec:
+    rand = (rng or random).random
+    base = 1000.0 + rand() * 3000.0  # 1000–4000
+
+    # 四位数标的更常见的最小变动价位（游戏里更好看）
+    tick = [1.0, 2.0, 5.0, 10.0][int(rand() * 4)]
+
+    # 涨跌停、保证金比例保持你原来的风格
+    limit_pct = [0.08, 0.10, 0.12][int(rand() * 3)]
+    margin = [0.10, 0.12, 0.14][int(rand() * 3)]
+
+    # 价格上来后，乘数也可以稍微调小一点，不然权益/保证金波动太夸张
+    mult = [5, 10, 20][int(rand() * 3)]
+
+    return Spec(base=base, tick=tick, limit_pct=limit_pct, margin=margin, mult=mult)
+
+
+def init_market(symbol: str, code: str, spec: Spec, rng: random.Random | None = None) -> Market:
+    rand = (rng or random).random
     prev_settle = round_to(spec.base, spec.tick)
     limit_up = round_to(prev_settle * (1 + spec.limit_pct), spec.tick)
     limit_down = round_to(prev_settle * (1 - spec.limit_pct), spec.tick)
     open_px = clamp(
-        round_to(prev_settle * (1 + (random.random() - 0.5) * 0.01), spec.tick),
+        round_to(prev_settle * (1 + (rand() - 0.5) * 0.01), spec.tick),
         limit_down,
         limit_up,
     )
@@ -40,13 +71,80 @@ def init_market(symbol: str, code: str, spec: Spec) -> Market:
         low=open_px,
         last=open_px,
         vol=0,
-        oi=int(2000 + random.random() * 6000),
+        oi=int(2000 + rand() * 6000),
         series=[open_px] * 120,
     )
 
 
-def advance_market_tick(m: Market, spec: Spec) -> None:
-    step = spec.tick * (-1 if random.random() < 0.5 else 1) * (1 + int(random.random() * 3))
+# 一个交易日多少个 tick：每走满这么多个 tick 收盘一次（记日K、按收盘价重算涨跌停）
+TICKS_PER_DAY = 20
+
+
+# 同一货品各月份的联动：每个 tick 共用一个主步长（近远月同涨同跌），
+# 各月份再各自以这个概率多走 / 少走 1 个 tick，价差慢慢游走，又被各自的均值回归拉住
+CURVE_NOISE = 0.15
+# advance_curve 一次抽一个大随机整数再按混合进制拆开：主步长 2（方向）x 3（1–3 个 tick），
+# 每个月份 20 档扰动（CURVE_NOISE 对应其中 3 档）x 6 档成交量；多抽 32 位让取模的偏差可以忽略
+_NOISE_SLOTS = 20
+_NOISE_CUT = round(CURVE_NOISE * _NOISE_SLOTS)
+_VOL_SLOTS = 6
+_MONTH_SLOTS = _NOISE_SLOTS * _VOL_SLOTS
+_MONTH_BITS = (_MONTH_SLOTS - 1).bit_length()
+_SPARE_BITS = 32 + 3
+
+CURVE_MODES = ("all", "main")
+
+
+@lru_cache(maxsize=None)
+def curve_mode_from_env() -> str:
+    """ENDFIELD_CURVE=all|main：main 只推进各货品的主力月，远月报价不动（只随日切重算涨跌停），
+    整个 advance_tick 大约快 40%（bench.bench_curve）。"""
+    mode = os.environ.get("ENDFIELD_CURVE", "all")
+    if mode not in CURVE_MODES:
+        raise ValueError(f"unknown curve mode: {mode}")
+    return mode
+
+
+def advance_market_tick(m: Market, spec: Spec, rng: random.Random | None = None) -> None:
+    rand = (rng or random).random
+    step = spec.tick * (-1 if rand() < 0.5 else 1) * (1 + int(rand() * 3))
+    _apply_step(m, spec, step, rand)
+
+
+def advance_curve(curve: list[Market], spec: Spec, rng: random.Random | None = None) -> None:
+    """一个货品的全部月份一起推进一个 tick。
+
+    规则和 advance_market_tick 一样（步长取整、1% 均值回归、涨跌停截断），只是按货品成批算：
+    主步长和各月份的扰动 / 成交量一次抽出来，tick 等常量只取一次，逐月只剩几步算术，不再逐个调函数。
+    """
+    r = (rng or random).getrandbits(_SPARE_BITS + _MONTH_BITS * len(curve))
+    r, sign = divmod(r, 2)
+    r, size = divmod(r, 3)
+    common = size + 1 if sign else -1 - size
+    tick = spec.tick
+    for m in curve:
+        r, u = divmod(r, _MONTH_SLOTS)
+        noise, vol = divmod(u, _VOL_SLOTS)
+        units = common - 1 if noise < _NOISE_CUT else common + 1 if noise >= _NOISE_SLOTS - _NOISE_CUT else common
+        nxt = round((m.last + tick * units) / tick) * tick
+        # tiny mean reversion
+        nxt = round((nxt + (m.prev_settle - nxt) * 0.01) / tick) * tick
+        if nxt > m.limit_up:
+            nxt = m.limit_up
+        elif nxt < m.limit_down:
+            nxt = m.limit_down
+
+        m.last = nxt
+        if nxt > m.high:
+            m.high = nxt
+        elif nxt < m.low:
+            m.low = nxt
+        m.vol += 1 + vol
+        m.rev += 1
+        m.series.append(nxt)
+
+
+def _apply_step(m: Market, spec: Spec, step: float, rand: Callable[[], float]) -> None:
     nxt = round_to(m.last + step, spec.tick)
 
     # tiny mean reversion
@@ -58,11 +156,10 @@ def advance_market_tick(m: Market, spec: Spec) -> None:
     m.last = nxt
     m.high = max(m.high, nxt)
     m.low = min(m.low, nxt)
-    m.vol += int(1 + random.random() * 6)
+    m.vol += int(1 + rand() * 6)
+    m.rev += 1
 
-    m.series.append(nxt)
-    if len(m.series) > 180:
-        m.series.pop(0)
+    m.series.append(nxt)  # 环形缓冲，满了自动挤掉最旧的点
 
 def roll_market_day(m: Market, spec: Spec) -> None:
     # 以最后一个 tick 的价格作为新昨结
@@ -76,4 +173,25 @@ def roll_market_day(m: Market, spec: Spec) -> None:
     m.open = new_prev
     m.high = new_prev
     m.low = new_prev
-    m.vol = 0
\ No newline at end of file
+    m.vol = 0
+    m.rev += 1
+
+
+def advance_curves(curves: list[list[Market]], specs: dict[str, Spec], rng: random.Random | None = None) -> None:
+    # 推进一轮全部合约，curves 按货品分组（每组是同一货品的各个月份）
+    for curve in curves:
+        advance_curve(curve, specs[curve[0].code], rng)
+
+
+def close_day(markets: Iterable[Market], specs: dict[str, Spec], day_klines: dict[str, list[dict]], day: int) -> None:
+    # 收盘：记一根日K，再按收盘价滚到下一天
+    for m in markets:
+        day_klines.setdefault(m.symbol, []).append({
+            "day": day,
+            "open": m.open,
+            "high": m.high,
+            "low": m.low,
+            "close": m.last,
+            "vol": m.vol,
+        })
+        roll_market_day(m, specs[m.code])
@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+from bisect import bisect_left, bisect_right, insort
+from typing import Iterator
+
 from backend.engine.models import Market, Order
 
 
@@ -13,3 +16,99 @@ def is_marketable(o: Order, m: Market) -> bool:
 def fee_for(qty: int) -> float:
     # demo: 2 券/手
     return 2.0 * qty
+
+
+class _BookSide:
+    # 一个合约的一侧：价位升序列表 + 每个价位按时间先后排队的委托
+    __slots__ = ("prices", "levels")
+
+    def __init__(self) -> None:
+        self.prices: list[float] = []
+        self.levels: dict[float, list[Order]] = {}
+
+    def add(self, o: Order) -> None:
+        level = self.levels.get(o.price)
+        if level is None:
+            level = self.levels[o.price] = []
+            insort(self.prices, o.price)
+        level.append(o)
+
+    def remove(self, o: Order) -> None:
+        level = self.levels.get(o.price)
+        if level is None:
+            return
+        try:
+            level.remove(o)
+        except ValueError:
+            return
+        if not level:
+            del self.levels[o.price]
+            del self.prices[bisect_left(self.prices, o.price)]
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+
+class OrderBook:
+    """按合约、按价位索引的未成交委托簿（只放 status == "new" 的委托）。
+
+    撮合只看被最新价穿过的价位：买单价 >= last 的价位、卖单价 <= last 的价位，
+    成本和可成交委托数成正比，和历史委托数量无关。
+    """
+
+    def __init__(self) -> None:
+        self._bids: dict[str, _BookSide] = {}
+        self._asks: dict[str, _BookSide] = {}
+        self._orders: dict[int, Order] = {}
+
+    def add(self, o: Order) -> None:
+        book = self._bids if o.side == "buy" else self._asks
+        side = book.get(o.symbol)
+        if side is None:
+            side = book[o.symbol] = _BookSide()
+        side.add(o)
+        self._orders[o.order_id] = o
+
+    def remove(self, o: Order) -> None:
+        if self._orders.pop(o.order_id, None) is None:
+            return
+        book = self._bids if o.side == "buy" else self._asks
+        side = book.get(o.symbol)
+        if side is None:
+            return
+        side.remove(o)
+        if not side:
+            del book[o.symbol]
+
+    def clear(self) -> list[Order]:
+        orders = list(self._orders.values())
+        self._bids.clear()
+        self._asks.clear()
+        self._orders.clear()
+        return orders
+
+    def symbols(self) -> set[str]:
+        return set(self._bids) | set(self._asks)
+
+    def crossed(self, symbol: str, last: float) -> list[Order]:
+        """被 last 穿过的委托（不移出委托簿），按 order_id 先后排序。"""
+        out: list[Order] = []
+        bids = self._bids.get(symbol)
+        if bids is not None:
+            for px in bids.prices[bisect_left(bids.prices, last):]:
+                out.extend(bids.levels[px])
+        asks = self._asks.get(symbol)
+        if asks is not None:
+            for px in asks.prices[: bisect_right(asks.prices, last)]:
+                out.extend(asks.levels[px])
+        out.sort(key=lambda o: o.order_id)
+        return out
+
+    def __iter__(self) -> Iterator[Order]:
+        return iter(self._orders.values())
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    def __contains__(self, order_id: int) -> bool:
+        return order_id in self._orders
@@ -1,6 +1,11 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
+
+from backend.engine.ringbuf import FloatRing
+
+# 每个合约保留的分时点数（超出后最旧的点被挤掉）
+SERIES_CAP = 180
 
 
 @dataclass
@@ -12,7 +17,8 @@ class Spec:
     mult: int
 
 
-@dataclass
+# slots：行情推进每个 tick 每个合约要读写十来个字段，slots 的属性访问比实例字典快
+@dataclass(slots=True)
 class Market:
     symbol: str
     code: str
@@ -25,7 +31,24 @@ class Market:
     last: float
     vol: int
     oi: int
-    series: list[float]
+    series: FloatRing
+    # 修订号：报价 / 涨跌停 / 成交量每改一次 +1，预编码片段按它判断是否过期；只在内存里，不存档
+    rev: int = 0
+
+    def __post_init__(self) -> None:
+        # 存档 / 旧代码传进来的是 list
+        if not isinstance(self.series, FloatRing):
+            self.series = FloatRing(SERIES_CAP, self.series)
+
+
+_MARKET_ROW = tuple(f.name for f in fields(Market) if f.name not in ("series", "rev"))
+
+
+def market_row(m: Market) -> dict:
+    # 存档用：asdict 会逐个元素深拷贝 series，这里直接从环形缓冲导出一次列表；rev 不存
+    d = {k: getattr(m, k) for k in _MARKET_ROW}
+    d["series"] = m.series.tolist()
+    return d
 
 
 @dataclass
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+from array import array
+from typing import Iterable, Iterator
+
+
+class FloatRing:
+    """定长浮点环形缓冲：O(1) 追加/淘汰，最近 N 个点可以零拷贝取出。
+
+    底层是 2 * capacity 的 array('d')，每个值同时写在 i 和 i + capacity 两处，
+    所以任意“最近 N 个”窗口在内存里都是连续的，直接切 memoryview 即可。
+    """
+
+    __slots__ = ("capacity", "appended", "_buf", "_pos", "_len")
+
+    def __init__(self, capacity: int, values: Iterable[float] = ()) -> None:
+        if capacity <= 0:
+            raise ValueError("capacity must be > 0")
+        self.capacity = capacity
+        self._buf = array("d", bytes(16 * capacity))
+        self._pos = 0
+        self._len = 0
+        # 累计追加过多少个点（只增不减，推送端据此算出新增了哪些点；不入库）
+        self.appended = 0
+        self.extend(values)
+
+    def append(self, value: float) -> None:
+        # 每个合约每个 tick 都要追加一次：局部变量、不取模，少几次属性读写
+        cap, pos, buf = self.capacity, self._pos, self._buf
+        buf[pos] = value
+        buf[pos + cap] = value
+        pos += 1
+        self._pos = 0 if pos == cap else pos
+        if self._len < cap:
+            self._len += 1
+        self.appended += 1
+
+    def extend(self, values: Iterable[float]) -> None:
+        for v in values:
+            self.append(v)
+
+    def last(self, n: int | None = None) -> memoryview:
+        """最近 n 个点（默认全部），按时间先后排列；返回的是视图，不复制。"""
+        n = self._len if n is None else max(0, min(n, self._len))
+        end = self._pos + self.capacity
+        return memoryview(self._buf)[end - n : end]
+
+    def tolist(self, n: int | None = None) -> list[float]:
+        return self.last(n).tolist()
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[float]:
+        return iter(self.last())
+
+    def __getitem__(self, i: int) -> float:
+        return self.last()[i]
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, FloatRing):
+            return self.last() == other.last()
+        if isinstance(other, list):
+            return self.tolist() == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"FloatRing({self.capacity}, {self.tolist()!r})"
+
+    def __getstate__(self) -> tuple:
+        return (self.capacity, self.tolist())
+
+    def __setstate__(self, state: tuple) -> None:
+        capacity, values = state
+        self.__init__(capacity, values)
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import random
+import threading
+from dataclasses import asdict
+
+from backend.engine.catalog import get_catalog
+from backend.engine.market import TICKS_PER_DAY, advance_curves, curve_mode_from_env, close_day, init_market, new_seed, random_spec
+from backend.engine.models import Market, Spec, market_row
+
+# 多人共享行情（ENDFIELD_MARKET_MODE=shared）：全服只有一份行情，每个 tick 只模拟一次。
+# GameState 直接引用这里的 specs / market / day_klines，自己只保留账户、持仓、委托、成交；
+# 每次访问 session 时再把错过的 tick 追上（撮合、风控、公告），见 GameState.synced()。
+
+
+class SharedMarket:
+    def __init__(self, seed: int | None = None) -> None:
+        self.catalog = get_catalog()
+        self.contract_months = self.catalog.contract_months
+        self.products = self.catalog.products
+        # 和 GameState 一样：第 n 个 tick 的行情只取决于种子和 n
+        self.seed = new_seed() if seed is None else int(seed)
+
+        rng = self._rng("init")
+        self.specs: dict[str, Spec] = {p["code"]: random_spec(rng) for p in self.products}
+        self.market: dict[str, Market] = {}
+        for p in self.products:
+            code = p["code"]
+            for ym in self.contract_months:
+                symbol = f"{code}{ym}"
+                self.market[symbol] = init_market(symbol=symbol, code=code, spec=self.specs[code], rng=rng)
+        self.day_klines: dict[str, list[dict]] = {sym: [] for sym in self.market}
+
+        self.tick = 0
+        self.ticks_per_day = TICKS_PER_DAY
+        self.curve_mode = curve_mode_from_env()
+        # 推进行情和 session 追行情都持有这把锁，session 不会看到推进到一半的报价
+        self.lock = threading.RLock()
+        self.dirty = True
+        # 预编码的行情 / 日K 片段，所有 session 共用（见 GameState._fragment）
+        self.fragments: dict[tuple[str, str], tuple] = {}
+
+    def _rng(self, label: str) -> random.Random:
+        return random.Random(f"{self.seed}:{label}")
+
+    def advance(self) -> None:
+        with self.lock:
+            curves = [[self.market[sym] for sym in curve] for curve in self.catalog.curves(self.curve_mode == "main")]
+            advance_curves(curves, self.specs, self._rng(f"tick{self.tick}"))
+            self.tick += 1
+            if self.tick % self.ticks_per_day == 0:
+                close_day(self.market.values(), self.specs, self.day_klines, self.tick // self.ticks_per_day)
+            self.dirty = True
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                "catalog": self.catalog.version,
+                "specs": {k: asdict(v) for k, v in self.specs.items()},
+                "market": {k: market_row(m) for k, m in self.market.items()},
+                "day_klines": self.day_klines,
+                "tick": self.tick,
+                "ticks_per_day": self.ticks_per_day,
+                "seed": self.seed,
+            }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "SharedMarket":
+        s = cls(seed=d.get("seed"))
+        s.catalog = get_catalog(int(d["catalog"]))
+        s.contract_months = s.catalog.contract_months
+        s.products = s.catalog.products
+        s.specs = {k: Spec(**v) for k, v in d["specs"].items()}
+        s.market = {k: Market(**v) for k, v in d["market"].items()}
+        klines = d.get("day_klines", {})
+        s.day_klines = {sym: list(klines.get(sym, [])) for sym in s.market}
+        s.tick = int(d.get("tick", 0))
+        s.ticks_per_day = int(d.get("ticks_per_day", s.ticks_per_day))
+        s.dirty = False
+        return s
@@ -1,49 +1,162 @@
 from __future__ import annotations
 
+import heapq
+import math
+import os
 import random
+from bisect import bisect_left, insort
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from itertools import islice
 from pathlib import Path
 from time import strftime
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator
 
-from fastapi import WebSocket
 from loguru import logger
 
-from backend.engine.market import advance_market_tick, init_market, round_to, clamp, now_str
-from backend.engine.matching import is_marketable, fee_for
-from backend.engine.models import Spec, Market, Position, Order, Trade
-from backend.engine.market import roll_market_day
+from backend.engine.catalog import catalog_for, get_catalog
+from backend.engine.market import TICKS_PER_DAY, advance_curves, curve_mode_from_env, close_day, init_market, new_seed, random_spec, round_to, clamp, now_str
+from backend.engine.matching import OrderBook, is_marketable, fee_for
+from backend.engine.models import Spec, Market, Position, Order, Trade, market_row
 from dataclasses import asdict
 import json
 
+if TYPE_CHECKING:
+    from backend.engine.shared import SharedMarket
+
+_DEBUG_ACCOUNT = os.environ.get("ENDFIELD_DEBUG_ACCOUNT") == "1"
+
+# 公告最多保留条数（deque 定长，满了自动挤掉最旧的）
+ROUND_LOG_CAP = 80
+# 委托变更流保留条数；推送端落后太多就改发全量委托
+FEED_CAP = 256
+# 内存里保留的最近成交 / 已结束委托条数；超过两倍时把更早的（已经落过盘的）挪去归档表，
+# 老玩家的 session 加载、序列化、返回的量都不再随游戏时长增长（更早的走 /api/history）
+TRADES_HOT = 500
+ORDERS_HOT = 500
+# 快进汇总里最多带回多少笔成交（更多的走 /api/state / /api/history）
+BULK_TRADES_MAX = 100
+# 快进汇总收集的风控公告
+_RISK_TITLES = ("风控状态", "强平触发")
+# state_payload 可选的分块（/api/state?fields=...）
+STATE_FIELDS = ("market", "account", "positions", "orders", "trades", "round_log", "day_klines")
+# 记进命令日志、读档时可以重放的操作
+JOURNAL_OPS = ("place_order", "cancel_all", "close_position", "advance_tick", "advance_ticks")
+# 每攒多少条命令（或推进多少个 tick，快进一条命令就能推进上千个）写一次完整快照；
+# 之间的落盘只追加命令日志。<= 1 表示每次都写快照（不靠重放恢复）
+SNAPSHOT_EVERY = int(os.environ.get("ENDFIELD_SNAPSHOT_EVERY", "100"))
+
+
+def _order_key(o: Order) -> int:
+    return o.order_id
+
+
+def _on_market(fn):
+    # 共享行情模式下，对外的操作都先追上最新行情，并在执行期间挡住行情推进
+    @wraps(fn)
+    def wrapper(self: "GameState", *args, **kwargs):
+        if self.shared is None:
+            return fn(self, *args, **kwargs)
+        with self.synced():
+            return fn(self, *args, **kwargs)
+
+    return wrapper
+
+
+def _journaled(normalize: Callable[..., tuple] | None = None):
+    # 对外的改状态操作：执行后记一条命令（见 to_delta / replay）。
+    # 记的是 normalize 整理过的参数，不是客户端原样发来的 dict；被拒绝（ok: False）或者什么都没改的不记。
+    # 命令里嵌套调到的（比如强平里的 cancel_all）和重放时执行的都不再记
+    def decorate(fn):
+        name = fn.__name__
+
+        @wraps(fn)
+        def wrapper(self: "GameState", *args):
+            if normalize is not None:
+                args = normalize(*args)
+            if self._cmd_ts is not None:
+                return fn(self, *args)
+            # 一条命令里产生的委托 / 成交 / 公告都用同一个时间戳，重放时原样复现
+            self._cmd_ts = ts = now_str()
+            before = self._change_marks()
+            try:
+                result = fn(self, *args)
+            finally:
+                self._cmd_ts = None
+            if (isinstance(result, dict) and result.get("ok") is False) or self._change_marks() == before:
+                return result
+            self._journal_seq += 1
+            self._journal.append((self._journal_seq, {"op": name, "args": list(args), "ts": ts}))
+            return result
+
+        return wrapper
+
+    return decorate
+
+
+def _text(payload: dict, key: str) -> str:
+    return str(payload.get(key, "")).strip()
+
+
+def _number(convert: Callable[[Any], Any], value: Any, invalid: Any) -> Any:
+    try:
+        return convert(value)
+    except (TypeError, ValueError, OverflowError):
+        return invalid
+
+
+def _order_args(payload: dict) -> tuple[dict]:
+    # 只留下单用到的字段、类型定死；解析不了的值换成会被 place_order 拒掉的值
+    if not isinstance(payload, dict):
+        payload = {}
+    return ({
+        "symbol": _text(payload, "symbol"),
+        "side": _text(payload, "side"),
+        "effect": _text(payload, "effect"),
+        "price": _number(float, payload.get("price", 0.0), math.nan),
+        "qty": _number(int, payload.get("qty", 0), 0),
+    },)
+
+
+def _close_args(payload: dict) -> tuple[dict]:
+    if not isinstance(payload, dict):
+        payload = {}
+    return ({"symbol": _text(payload, "symbol"), "side": _text(payload, "side"), "qty": _number(int, payload.get("qty", 0), 0)},)
+
+
+def _ticks_args(n: int) -> tuple[int]:
+    return (int(n),)
+
+
 class GameState:
-    def __init__(self, frontend_dir: Path) -> None:
+    def __init__(self, frontend_dir: Path, shared: SharedMarket | None = None, seed: int | None = None) -> None:
         self.frontend_dir = frontend_dir
-        self.contract_months = ["2603", "2604", "2606"]
-
-        self.products = [
-            {"code": "AKT", "name": "锚点厨具"},
-            {"code": "SKB", "name": "悬空骸骨骨雕"},
-            {"code": "WMD", "name": "巫术矿钻"},
-            {"code": "ANG", "name": "天使罐头"},
-            {"code": "HYR", "name": "谷地水培肉"},
-            {"code": "TUJ", "name": "团结牌口服液"},
-            {"code": "SEK", "name": "塞什卡牌石"},
-            {"code": "YSM", "name": "源石树幼苗"},
-            {"code": "JJD", "name": "警戒者矿锭"},
-            {"code": "XTK", "name": "星体晶块"},
-            {"code": "JMB", "name": "边角料积木"},
-            {"code": "HNK", "name": "硬脑壳头盔"},
-        ]
+        # 每个 session 自己的随机流：同一个种子 + 同样的操作，行情一模一样（可复现、可以换进程算）。
+        # 种子和重置次数随存档保存；具体怎么派生见 _rng
+        self.seed = new_seed() if seed is None else int(seed)
+        self._rng_epoch = 0
+        # 共享行情模式：specs / market / day_klines 直接引用全服那一份，这里不再各自模拟
+        self.shared = shared
+        # 货品 / 合约月份来自进程共享的只读 catalog，不要原地修改
+        self.catalog = get_catalog() if shared is None else shared.catalog
+        self.contract_months = self.catalog.contract_months
+        self.products = self.catalog.products
 
         self.specs: dict[str, Spec] = {}
-        for p in self.products:
-            self.specs[p["code"]] = self._make_spec()
-
         self.market: dict[str, Market] = {}
-        for p in self.products:
-            code = p["code"]
-            for ym in self.contract_months:
-                symbol = f"{code}{ym}"
-                self.market[symbol] = init_market(symbol=symbol, code=code, spec=self.specs[code])
+        if shared is not None:
+            self.specs = shared.specs
+            self.market = shared.market
+        else:
+            rng = self._rng("init")
+            for p in self.products:
+                self.specs[p["code"]] = self._make_spec(rng)
+            for p in self.products:
+                code = p["code"]
+                for ym in self.contract_months:
+                    symbol = f"{code}{ym}"
+                    self.market[symbol] = init_market(symbol=symbol, code=code, spec=self.specs[code], rng=rng)
 
         # Account snapshot (single player demo)
         self.cash = 200000.0  # 调度券余额
@@ -63,50 +176,90 @@ class GameState:
         self.risk_msg = ""
         self.auto_liquidate = True  # 调试开关：是否自动强平
 
-        self.positions: list[Position] = []
-        self.orders: list[Order] = []
+        # 持仓按 (symbol, side) 索引；dict 保持插入顺序，展示 / 落盘顺序和以前的列表一致
+        self.positions: dict[tuple[str, str], Position] = {}
+        self._rebuild_exposure()
+        # 未成交委托在按价位索引的委托簿里；成交 / 撤销后移到归档，撮合不再扫它们
+        self.book = OrderBook()
+        self.order_archive: list[Order] = []
         self.trades: list[Trade] = []
-        self.tick = 0
-        self.ticks_per_day = 20 
-        self.round_log: list[dict] = []
+        # 已经移出内存的成交条数：self.trades[i] 的成交序号（从 0 起）是 _trades_archived + i
+        self._trades_archived = 0
+        # order_id < _orders_floor 的已结束委托已经移出内存（未成交的始终在 book 里）
+        self._orders_floor = 0
+        self._orders_archived = 0
+        self.tick = 0 if shared is None else shared.tick
+        self.ticks_per_day = TICKS_PER_DAY if shared is None else shared.ticks_per_day
+        self.round_log: deque[dict] = deque(maxlen=ROUND_LOG_CAP)
 
         self._order_id = 1000
-        self.ws_clients: dict[str, WebSocket] = {}
+        # all 推进全部月份，main 只推进主力月（ENDFIELD_CURVE）
+        self.curve_mode = curve_mode_from_env()
+        # 推送用的变更流（只在内存里，见 backend/stream.py）
+        self._order_feed: deque[tuple[int, Order]] = deque(maxlen=FEED_CAP)
+        self._order_feed_seq = 0
+        self._log_seq = 0
+        # 快进（advance_ticks）期间收集风控事件；平时为 None
+        self._bulk: list[dict] | None = None
         self.day_klines: dict[str, list[dict]] = {}
-        for sym in self.market.keys():
-            self.day_klines[sym] = []
-
-    def _make_spec(self) -> Spec:
-        base = 1000.0 + random.random() * 3000.0  # 1000–4000
-
-        # 四位数标的更常见的最小变动价位（游戏里更好看）
-        tick = [1.0, 2.0, 5.0, 10.0][int(random.random() * 4)]
-
-        # 涨跌停、保证金比例保持你原来的风格
-        limit_pct = [0.08, 0.10, 0.12][int(random.random() * 3)]
-        margin = [0.10, 0.12, 0.14][int(random.random() * 3)]
-
-        # 价格上来后，乘数也可以稍微调小一点，不然权益/保证金波动太夸张
-        mult = [5, 10, 20][int(random.random() * 3)]
-
-        return Spec(base=base, tick=tick, limit_pct=limit_pct, margin=margin, mult=mult)
+        if shared is not None:
+            self.day_klines = shared.day_klines
+        else:
+            for sym in self.market.keys():
+                self.day_klines[sym] = []
+
+        # --------- 增量落盘的脏标记（见 to_delta） ----------
+        # 新局 / 旧版整包存档 / 重置之后需要整体重写一次
+        self._full_rewrite = True
+        self._dirty_markets: set[str] = set()
+        self._dirty_orders: dict[int, Order] = {}
+        self._saved_trades = 0
+        self._saved_klines: dict[str, int] = {}
+        # 库里 sessions.version 的值（读档时带出来，每次写成功 +1）；写库时按它做 compare-and-swap
+        self._db_version = 0
+        # 命令日志：还没写进库的 (序号, 命令)；_snapshot_seq / _snapshot_tick 是最近一次快照时的序号和 tick
+        self._journal: list[tuple[int, dict]] = []
+        self._journal_seq = 0
+        self._snapshot_seq = 0
+        self._snapshot_tick = self.tick
+        # 正在执行的命令的时间戳（命令之外为 None）
+        self._cmd_ts: str | None = None
+        # 共享行情下追过行情、还没被缓存标脏（见 pop_caught_up）
+        self._caught_up = False
+
+        # 预编码的行情 / 日K 片段（见 _fragment）；共享行情模式下全服共用一份
+        self._fragments: dict[tuple[str, str], tuple] = {} if shared is None else shared.fragments
+
+    @property
+    def orders(self) -> list[Order]:
+        # 全部委托（归档 + 未成交），按下单先后排序；只给展示 / 落盘用，撮合走 self.book
+        return list(heapq.merge(self.order_archive, sorted(self.book, key=_order_key), key=_order_key))
+
+    @property
+    def trade_count(self) -> int:
+        # 累计成交笔数（含已归档的），也是下一笔成交的序号
+        return self._trades_archived + len(self.trades)
+
+    def _archive_order(self, o: Order) -> None:
+        # 归档按 order_id 有序（一般就是追加到末尾），分页时可以直接二分
+        insort(self.order_archive, o, key=_order_key)
+
+    def _make_spec(self, rng: random.Random) -> Spec:
+        return random_spec(rng)
+
+    def _rng(self, label: str) -> random.Random:
+        """(种子, 重置次数, 用途) 唯一确定的一条随机流。
+
+        每个 tick 用自己的一条（label 带 tick 号），所以第 n 个 tick 的行情只取决于种子和 n：
+        逐个推进、快进、进程重启后接着推进，结果都一样；随机流本身不用存档。
+        """
+        return random.Random(f"{self.seed}:{self._rng_epoch}:{label}")
 
     def _main_contract(self, code: str) -> str:
-        return f"{code}{self.contract_months[0]}"
+        return self.catalog.main_contract(code)
 
     def bootstrap_payload(self) -> dict:
-        products = []
-        for p in self.products:
-            code = p["code"]
-            asset = self.frontend_dir / "assets" / f"{code}.png"
-            products.append(
-                {
-                    "code": code,
-                    "name": p["name"],
-                    "asset_file": f"/assets/{code}.png" if asset.exists() else None,
-                    "main_contract": self._main_contract(code),
-                }
-            )
+        products = self.catalog.bootstrap_products(self.frontend_dir)
         specs = {
             code: {
                 "tick": s.tick,
@@ -118,22 +271,120 @@ class GameState:
         }
         return {"products": products, "specs": specs}
 
-    def state_payload(self) -> dict:
-        market = {k: self._market_payload(v) for k, v in self.market.items() if k.endswith(self.contract_months[0])}
-        self._risk_update_only("状态刷新")
-        # Only return main contracts for list + active chart simplicity
-        # (You can expand later to all contracts)
-        return {
-            "market": market,
-            "account": self._account_payload(),
-            "positions": [self._position_payload(p) for p in self.positions],
-            "orders": [self._order_payload(o) for o in self.orders],
-            "trades": [self._trade_payload(t) for t in self.trades],
-            "round_log": self.round_log[-40:],
-            "day_klines": self.day_klines,
-        }
+    @_on_market
+    def state_payload(
+        self,
+        fields: Iterable[str] | None = None,
+        symbol: str | None = None,
+        since: int | None = None,
+        limit: int | None = None,
+        before: int | None = None,
+        fragment: Callable[[Any], Any] | None = None,
+        months: Iterable[str] | None = None,
+    ) -> dict:
+        """前端要的状态。默认全量；各参数只影响对应分块，没要的分块不计算：
+
+        fields  只返回这些分块（见 STATE_FIELDS）
+        symbol  market / day_klines 只给这一个合约
+        months  market / day_klines 给哪些合约月份，默认只给主力月（全部月份都在模拟，按需取）
+        since   trades 只给成交序号 > since 的前 limit 条（序号从 1 开始，见返回的 trades_page）
+        limit / before  trades 按成交序号、orders 按 order_id 往前翻页：取 < before 的最后 limit 条
+        fragment  传入编码函数（如 backend.fastjson.fragment）时，行情 / 日K 按合约预编码并缓存，
+                  合约没动就直接复用上次的结果
+        """
+        want = STATE_FIELDS if fields is None else set(fields)
+        out: dict = {}
+        if symbol is not None:
+            syms = [symbol]
+        else:
+            picked = set(self.contract_months[:1] if months is None else months)
+            syms = [f"{p['code']}{ym}" for p in self.products for ym in self.contract_months if ym in picked]
+        if "market" in want:
+            if fragment is None:
+                out["market"] = {k: self._market_payload(self.market[k]) for k in syms}
+            else:
+                out["market"] = {k: self._market_fragment(k, fragment) for k in syms}
+        if "account" in want:
+            # 只读：风控状态在改账户 / 行情的地方（成交、平仓、每个 tick）已经刷新过，这里不再改状态
+            out["account"] = self._account_payload()
+        if "positions" in want:
+            out["positions"] = [self._position_payload(p) for p in self.positions.values()]
+        if "orders" in want:
+            orders, total = self._orders_page(limit, before)
+            out["orders"] = [self._order_payload(o) for o in orders]
+            out["orders_page"] = {"total": total}
+        if "trades" in want:
+            start, end = self._trades_page(since, limit, before)
+            base = self._trades_archived
+            out["trades"] = [self._trade_payload(t) for t in self.trades[start - base : end - base]]
+            out["trades_page"] = {"from": start + 1, "to": end, "total": self.trade_count, "archived": base}
+        if "round_log" in want:
+            out["round_log"] = list(islice(self.round_log, max(0, len(self.round_log) - 40), None))
+        if "day_klines" in want:
+            klines = {k: self.day_klines.get(k, []) for k in syms}
+            if fragment is not None:
+                klines = {k: self._klines_fragment(k, rows, fragment) for k, rows in klines.items()}
+            out["day_klines"] = klines
+        return out
+
+    def _market_fragment(self, symbol: str, fragment: Callable[[Any], Any]) -> Any:
+        # 推进报价和换日都会 +1 rev（ENDFIELD_CURVE=main 时远月只在换日时变，分时不追加）
+        m = self.market[symbol]
+        return self._fragment(("market", symbol), m, m.rev, lambda: self._market_payload(m), fragment)
+
+    def _klines_fragment(self, symbol: str, rows: list[dict], fragment: Callable[[Any], Any]) -> Any:
+        # 日K 只追加
+        return self._fragment(("day_klines", symbol), rows, len(rows), lambda: rows, fragment)
+
+    def _fragment(
+        self,
+        key: tuple[str, str],
+        source: object,
+        stamp: int,
+        build: Callable[[], Any],
+        fragment: Callable[[Any], Any],
+    ) -> Any:
+        hit = self._fragments.get(key)
+        if hit is not None and hit[0] is source and hit[1] == stamp and hit[2] is fragment:
+            return hit[3]
+        frag = fragment(build())
+        self._fragments[key] = (source, stamp, fragment, frag)
+        return frag
+
+    def _trades_page(self, since: int | None, limit: int | None, before: int | None) -> tuple[int, int]:
+        # 成交只追加，序号 n 就是 self.trades[n - 1 - _trades_archived]，切片不用扫描；
+        # 只在内存窗口里取，更早的由 /api/history 查归档
+        base, total = self._trades_archived, self.trade_count
+        end = total if before is None else max(base, min(before - 1, total))
+        if since is not None:
+            # 增量拉取：从 since 往后取，limit 截断的部分下次接着拉
+            start = max(base, min(since, end))
+            if limit is not None:
+                end = min(end, start + limit)
+        else:
+            # 翻历史：取 before 之前的最后 limit 条
+            start = base if limit is None else max(base, end - limit)
+        return start, end
+
+    def _orders_page(self, limit: int | None, before: int | None) -> tuple[list[Order], int]:
+        total = self._orders_archived + len(self.order_archive) + len(self.book)
+        if limit is None and before is None:
+            return self.orders, total
+        # 归档按 order_id 有序，先二分截出候选，再和（很少的）未成交委托合并
+        hi = len(self.order_archive) if before is None else bisect_left(self.order_archive, before, key=_order_key)
+        lo = 0 if limit is None else max(0, hi - limit)
+        live = sorted((o for o in self.book if before is None or o.order_id < before), key=_order_key)
+        merged = list(heapq.merge(self.order_archive[lo:hi], live, key=_order_key))
+        if limit is not None:
+            merged = merged[-limit:]
+        return merged, total
 
     def _market_payload(self, m: Market) -> dict:
+        d = self._market_scalars(m)
+        d["series"] = m.series.tolist()
+        return d
+
+    def _market_scalars(self, m: Market) -> dict:
         return {
             "symbol": m.symbol,
             "prev_settle": m.prev_settle,
@@ -145,21 +396,84 @@ class GameState:
             "last": m.last,
             "vol": m.vol,
             "oi": m.oi,
-            "series": m.series,
         }
 
+    # --------- Account aggregates ----------
+    # 浮动盈亏 / 占用保证金按合约维护：成交、平仓、行情变动时只重算受影响的合约，
+    # 取账户数据是 O(1)。ENDFIELD_DEBUG_ACCOUNT=1 时每次都和全量重算对一遍。
+    def _refresh_exposure(self, symbol: str) -> None:
+        upnl = 0.0
+        margin = 0.0
+        held = False
+        m = self.market.get(symbol)
+        for side in ("long", "short"):
+            p = self.positions.get((symbol, side))
+            if p is None or m is None:
+                continue
+            held = True
+            diff = m.last - p.avg_open
+            upnl += (diff if side == "long" else -diff) * p.mult * p.qty
+            spec = self.specs[m.code]
+            margin += m.last * spec.mult * p.qty * spec.margin
+
+        self._upnl_total -= self._sym_upnl.pop(symbol, 0.0)
+        self._margin_total -= self._sym_margin.pop(symbol, 0.0)
+        if held:
+            self._sym_upnl[symbol] = upnl
+            self._sym_margin[symbol] = margin
+            self._upnl_total += upnl
+            self._margin_total += margin
+        elif not self._sym_upnl:
+            # 空仓时清掉累计误差
+            self._upnl_total = 0.0
+            self._margin_total = 0.0
+
+    def _rebuild_exposure(self) -> None:
+        self._sym_upnl: dict[str, float] = {}
+        self._sym_margin: dict[str, float] = {}
+        self._upnl_total = 0.0
+        self._margin_total = 0.0
+        for symbol in {sym for sym, _ in self.positions}:
+            self._refresh_exposure(symbol)
+
+    def _on_prices(self, symbols: Iterable[str]) -> None:
+        for sym in symbols:
+            if sym in self._sym_upnl:
+                self._refresh_exposure(sym)
+
     def _unrealized_pnl(self) -> float:
+        if _DEBUG_ACCOUNT:
+            self._check_exposure()
+        return self._upnl_total
+
+    def _margin_used(self) -> float:
+        if _DEBUG_ACCOUNT:
+            self._check_exposure()
+        return self._margin_total
+
+    def _check_exposure(self) -> None:
+        upnl, margin = self._unrealized_pnl_full(), self._margin_used_full()
+        if not (
+            math.isclose(upnl, self._upnl_total, rel_tol=1e-9, abs_tol=1e-6)
+            and math.isclose(margin, self._margin_total, rel_tol=1e-9, abs_tol=1e-6)
+        ):
+            raise AssertionError(
+                f"account aggregates drifted: upnl {self._upnl_total} != {upnl}, "
+                f"margin {self._margin_total} != {margin}"
+            )
+
+    def _unrealized_pnl_full(self) -> float:
         total = 0.0
-        for p in self.positions:
+        for p in self.positions.values():
             m = self.market[p.symbol]
             diff = m.last - p.avg_open
             pnl = (diff if p.side == "long" else -diff) * p.mult * p.qty
             total += pnl
         return total
 
-    def _margin_used(self) -> float:
+    def _margin_used_full(self) -> float:
         mu = 0.0
-        for p in self.positions:
+        for p in self.positions.values():
             m = self.market[p.symbol]
             spec = self.specs[m.code]
             notional = m.last * spec.mult * p.qty
@@ -225,59 +539,139 @@ class GameState:
         }
 
     # --------- Core actions ----------
+    @_journaled()
+    @_on_market
     def advance_tick(self) -> None:
-        # advance all MAIN contracts
-        for p in self.products:
-            code = p["code"]
-            sym = self._main_contract(code)
-            m = self.market[sym]
-            advance_market_tick(m, self.specs[code])
-
-        # attempt match pending orders (main contracts only)
-        for o in self.orders:
-            if o.status != "new":
-                continue
-            m = self.market[o.symbol]
-            if is_marketable(o, m):
-                self._fill_order(o, m.last)
+        if self.shared is not None:
+            # 共享行情由服务端统一推进（SharedMarket.advance），这里只需要追上（装饰器里已经做了）
+            return
 
-        # risk check (tick)
-        self._risk_check_and_act("Tick 推进")
+        self._advance_once(*self._curves())
+
+    @_journaled(_ticks_args)
+    @_on_market
+    def advance_ticks(self, n: int) -> dict:
+        """快进 n 个 tick，返回这段时间的汇总（成交、风控事件、账户）。
+
+        行情、撮合、风控、日K 和连着调 n 次 advance_tick 完全一样，只有公告不同：
+        每个 tick 一条的「Tick 推进」合成最后一条「快进」，成交 / 风控 / 换日公告照常记。
+        """
+        if self.shared is not None:
+            raise ValueError("shared market cannot be fast-forwarded per session")
+        start_tick, start_trades = self.tick, self.trade_count
+        start_fees, start_pnl = self.fees, self.realized_pnl
+        curves, symbols = self._curves()
+        self._bulk = events = []
+        try:
+            for _ in range(n):
+                self._advance_once(curves, symbols)
+        finally:
+            self._bulk = None
+
+        days = self.tick // self.ticks_per_day - start_tick // self.ticks_per_day
+        fills = self.trade_count - start_trades
+        self._append_log("快进", f"推进 {n} 个 tick（换日 {days} 次），成交 {fills} 笔")
+        new_trades = self.trades[max(0, len(self.trades) - min(fills, BULK_TRADES_MAX)) :] if fills else []
+        return {
+            "ticks": n,
+            "tick": self.tick,
+            "days": days,
+            "fills": fills,
+            "trades": [self._trade_payload(t) for t in new_trades],
+            "fees": self.fees - start_fees,
+            "realized_pnl": self.realized_pnl - start_pnl,
+            "risk_events": events,
+            "risk_state": self.risk_state,
+            "account": self._account_payload(),
+        }
+
+    def _curves(self) -> tuple[list[list[Market]], list[str]]:
+        # 每个货品一组（各个月份），组内走势相关；另外返回这一拍会动的合约
+        main_only = self.curve_mode == "main"
+        curves = [[self.market[sym] for sym in curve] for curve in self.catalog.curves(main_only)]
+        return curves, [curve[0].symbol for curve in curves] if main_only else list(self.market)
 
-        # round log
-        self._append_log("Tick 推进", "市场报价已更新一轮")
+    def _advance_once(self, curves: list[list[Market]], symbols: list[str]) -> None:
+        advance_curves(curves, self.specs, self._rng(f"tick{self.tick}"))
+        self._dirty_markets.update(symbols)
+        self._after_market_tick(symbols)
         # ...在 advance_tick 末尾（tick += 1 之后或之前都行，但建议之后）
         self.tick += 1
 
         if self.tick % self.ticks_per_day == 0:
-            day = self.tick // self.ticks_per_day  # 第几天（从1开始更直觉也行）
-
-            main_suffix = self.contract_months[0]
-            for sym, m in self.market.items():
-                if not sym.endswith(main_suffix):
-                    continue
-                self.day_klines.setdefault(sym, []).append({
-                    "day": day,
-                    "open": m.open,
-                    "high": m.high,
-                    "low": m.low,
-                    "close": m.last,
-                    "vol": m.vol,
-                })
-                roll_market_day(m, self.specs[m.code])
+            close_day(self.market.values(), self.specs, self.day_klines, self.tick // self.ticks_per_day)
+            # 换日会改所有合约（包括 ENDFIELD_CURVE=main 时不推进的远月）
+            self._dirty_markets.update(self.market)
+            self._append_log("换日", f"进入第 {self.tick // self.ticks_per_day + 1} 天，已按收盘价重算涨跌停")
+
+    def _after_market_tick(self, symbols: list[str]) -> None:
+        # 行情动过之后账户这一侧要做的事：重估浮盈、撮合、风控、公告
+        self._on_prices(symbols)
+
+        # attempt match pending orders: only price levels crossed by last
+        crossed: list[Order] = []
+        for sym in self.book.symbols():
+            crossed.extend(self.book.crossed(sym, self.market[sym].last))
+        crossed.sort(key=lambda o: o.order_id)
+        for o in crossed:
+            # 成交回报可能触发强平撤单，后面的委托要再看一眼状态
+            if o.status == "new":
+                self._fill_order(o, self.market[o.symbol].last)
+
+        # risk check (tick)
+        self._risk_check_and_act("Tick 推进")
+
+        # round log（快进时不逐个 tick 记，最后合成一条）
+        if self._bulk is None:
+            self._append_log("Tick 推进", "市场报价已更新一轮")
 
+    @contextmanager
+    def synced(self) -> Iterator[None]:
+        """共享行情模式：持有行情锁，并把这个账户追到行情的最新 tick。私有行情下什么都不做。"""
+        if self.shared is None:
+            yield
+            return
+        with self.shared.lock:
+            if self._catch_up():
+                self._caught_up = True
+            yield
+
+    def pop_caught_up(self) -> bool:
+        """上次调用以来有没有在读操作里追过行情（撮合 / 风控 / 换日都可能改了账户），取完清零。
+
+        共享行情下只读的接口也会改状态：缓存据此把只读访问也当成写，标脏、落盘。
+        """
+        caught, self._caught_up = self._caught_up, False
+        return caught
+
+    def _catch_up(self) -> bool:
+        shared = self.shared
+        if shared is None or self.tick == shared.tick:
+            return False
+        # 先记下新 tick：撮合 / 强平里还会调到对外的方法，不能再触发一次追赶
+        prev_day = self.tick // self.ticks_per_day
+        self.tick = shared.tick
+        # 错过的多个 tick 合成一次处理：只按最新价撮合和风控
+        self._after_market_tick(list(shared.market))
+        if self.tick // self.ticks_per_day != prev_day:
             self._append_log("换日", f"进入第 {self.tick // self.ticks_per_day + 1} 天，已按收盘价重算涨跌停")
+        return True
 
+    @_journaled(_order_args)
+    @_on_market
     def place_order(self, payload: dict) -> dict:
-        symbol = str(payload.get("symbol", "")).strip()
-        side = str(payload.get("side", "")).strip()
-        effect = str(payload.get("effect", "")).strip()
-        price = float(payload.get("price", 0.0))
-        qty = int(payload.get("qty", 0))
+        symbol, side, effect = payload["symbol"], payload["side"], payload["effect"]
+        price, qty = payload["price"], payload["qty"]
 
         if symbol not in self.market:
             return {"ok": False, "error": "unknown symbol"}
 
+        if side not in ("buy", "sell") or effect not in ("open", "close"):
+            return {"ok": False, "error": "invalid side or effect"}
+
+        if not math.isfinite(price):
+            return {"ok": False, "error": "invalid price"}
+
         if qty <= 0:
             return {"ok": False, "error": "qty must be > 0"}
 
@@ -312,28 +706,32 @@ class GameState:
             price=px,
             qty=qty,
             status="new",
-            ts=now_str(),
+            ts=self._now(),
         )
-        self.orders.append(o)
+        self._touch_order(o)
 
         # try immediate fill
         if is_marketable(o, m):
             self._fill_order(o, m.last)
+        else:
+            self.book.add(o)
 
         self._append_log("委托提交", f"{symbol} {side}/{effect} {qty}手 @ {px:.2f}")
         return {"ok": True, "order_id": o.order_id}
 
+    @_journaled()
+    @_on_market
     def cancel_all(self) -> None:
-        for o in self.orders:
-            if o.status == "new":
-                o.status = "cancelled"
+        for o in self.book.clear():
+            o.status = "cancelled"
+            self._touch_order(o)
+            self._archive_order(o)
         self._append_log("撤单", "已撤销所有未成交委托")
 
+    @_journaled(_close_args)
+    @_on_market
     def close_position(self, payload: dict) -> None:
-        symbol = str(payload.get("symbol", "")).strip()
-        side = str(payload.get("side", "")).strip()
-        qty = int(payload.get("qty", 0))
-        self._close_pos(symbol, side, qty, log_title="手动平仓")
+        self._close_pos(payload["symbol"], payload["side"], payload["qty"], log_title="手动平仓")
         self._risk_update_only("手动平仓")
 
 
@@ -377,48 +775,81 @@ class GameState:
         self.cancel_all()
         self._append_log("强平触发", f"{reason}：{self.risk_msg}")
 
-        # 循环减仓，直到回到安全线（这里回到 call_ratio，体验更像“强平到可维持”）
-        target = self.call_ratio
-
-        # 安全兜底：最多平掉所有手数 + 10 步，防止死循环
-        max_steps = sum(p.qty for p in self.positions) + 10
-        steps = 0
+        # 减仓直到回到安全线（这里回到 call_ratio，体验更像“强平到可维持”）
+        # 先一次算好每个仓位要平几手，再每个仓位平一笔
+        for (symbol, side), lots in self._plan_liquidation(self.call_ratio).items():
+            self._close_pos(symbol, side, lots, log_title="强平平仓")
 
-        while steps < max_steps and self.positions:
-            acc = self._account_payload_base()
-            ratio = self._compute_margin_ratio(acc["equity"], acc["margin_used"])
-            if ratio >= target:
-                break
+        # 强平结束后再刷新一次状态
+        self._risk_update_only("强平完成")
 
-            # 选当前占用保证金最大的仓位
-            best = None
-            best_mu = -1.0
-            for p in self.positions:
-                m = self.market[p.symbol]
-                spec = self.specs[m.code]
-                notional = m.last * spec.mult * p.qty
-                mu = notional * spec.margin
-                if mu > best_mu:
-                    best_mu = mu
-                    best = p
-
-            if best is None:
-                break
 
-            # 每次平 1 手，逐步释放保证金
-            self._close_pos(best.symbol, best.side, 1, log_title="强平平仓")
-            steps += 1
+    def _plan_liquidation(self, target: float) -> dict[tuple[str, str], int]:
+        """强平计划：{(symbol, side): 手数}，按首次被选中的先后排列。
 
-        # 强平结束后再刷新一次状态
-        self._risk_update_only("强平完成")
+        结果和“每次挑占用保证金最大的仓位平 1 手，直到维持率 >= target”逐手循环一致，
+        但不真的去平仓：平 1 手只会让权益少一笔手续费、占用保证金少 last * mult * margin，
+        所以每段连续平同一个仓位的手数可以直接解出来（到换成下一个仓位为止 / 到回到 target 为止）。
+        """
+        acc = self._account_payload_base()
+        equity, margin_used = acc["equity"], acc["margin_used"]
+        fee = fee_for(1)
 
+        units: dict[tuple[str, str], float] = {}
+        left: dict[tuple[str, str], int] = {}
+        heap: list[tuple[float, int, tuple[str, str]]] = []
+        for idx, (key, p) in enumerate(self.positions.items()):
+            m = self.market[p.symbol]
+            spec = self.specs[m.code]
+            units[key] = m.last * spec.mult * spec.margin
+            left[key] = p.qty
+            heap.append((-units[key] * p.qty, idx, key))
+        heapq.heapify(heap)
+
+        plan: dict[tuple[str, str], int] = {}
+        while heap:
+            if self._compute_margin_ratio(equity, margin_used) >= target:
+                break
+            _, idx, key = heapq.heappop(heap)
+            unit, qty = units[key], left[key]
+
+            # 这一段能连续平几手：直到它的占用保证金不再是最大（同额时先持有的优先）
+            k = qty
+            if heap:
+                next_mu, next_idx, _ = heap[0]
+                next_mu = -next_mu
+
+                def still_best(j: int) -> bool:
+                    mu = unit * (qty - j)
+                    return mu > next_mu or (mu == next_mu and idx < next_idx)
+
+                k = min(qty, max(1, int(qty - next_mu / unit) + 1)) if unit > 0 else 1
+                while k > 1 and not still_best(k - 1):
+                    k -= 1
+                while k < qty and still_best(k):
+                    k += 1
+
+            # 回到 target 还需要几手：(equity - fee*n) / (margin - unit*n) >= target
+            slope = target * unit - fee
+            if slope > 0:
+                need = max(1, math.ceil((target * margin_used - equity) / slope))
+                while need > 1 and self._compute_margin_ratio(
+                    equity - fee * (need - 1), margin_used - unit * (need - 1)
+                ) >= target:
+                    need -= 1
+                k = min(k, need)
+
+            plan[key] = plan.get(key, 0) + k
+            left[key] = qty - k
+            equity -= fee * k
+            margin_used -= unit * k
+            if left[key] > 0:
+                heapq.heappush(heap, (-unit * left[key], idx, key))
+        return plan
 
 # --------- Internal helpers ----------
     def _get_pos(self, symbol: str, side: str) -> Position | None:
-        for p in self.positions:
-            if p.symbol == symbol and p.side == side:
-                return p
-        return None
+        return self.positions.get((symbol, side))
 
 
     def _close_pos(self, symbol: str, side: str, qty: int, log_title: str) -> None:
@@ -440,18 +871,19 @@ class GameState:
 
         pos.qty -= q
         if pos.qty == 0:
-            self.positions = [p for p in self.positions if not (p.symbol == symbol and p.side == side)]
+            del self.positions[(symbol, side)]
+        self._refresh_exposure(symbol)
 
         self.trades.append(
             Trade(
-                trade_id=f"C{len(self.trades)+1}",
+                trade_id=f"C{self.trade_count + 1}",
                 symbol=symbol,
                 side="sell" if side == "long" else "buy",
                 effect="close",
                 price=m.last,
                 qty=q,
                 fee=fee,
-                ts=now_str(),
+                ts=self._now(),
             )
         )
 
@@ -466,6 +898,9 @@ class GameState:
 
         fee = fee_for(o.qty)
         o.status = "filled"
+        self._touch_order(o)
+        self.book.remove(o)
+        self._archive_order(o)
 
         self.trades.append(
             Trade(
@@ -476,7 +911,7 @@ class GameState:
                 price=fill_price,
                 qty=o.qty,
                 fee=fee,
-                ts=now_str(),
+                ts=self._now(),
             )
         )
         self.fees += fee
@@ -485,15 +920,13 @@ class GameState:
             pos_side = "long" if o.side == "buy" else "short"
             pos = self._get_pos(o.symbol, pos_side)
             if pos is None:
-                self.positions.append(
-                    Position(
-                        symbol=o.symbol,
-                        side=pos_side,
-                        qty=o.qty,
-                        avg_open=fill_price,
-                        mult=spec.mult,
-                        margin=fill_price * spec.mult * o.qty * spec.margin,
-                    )
+                self.positions[(o.symbol, pos_side)] = Position(
+                    symbol=o.symbol,
+                    side=pos_side,
+                    qty=o.qty,
+                    avg_open=fill_price,
+                    mult=spec.mult,
+                    margin=fill_price * spec.mult * o.qty * spec.margin,
                 )
             else:
                 new_qty = pos.qty + o.qty
@@ -514,39 +947,81 @@ class GameState:
             pos.qty -= q
             pos.margin = fill_price * spec.mult * pos.qty * spec.margin
             if pos.qty == 0:
-                self.positions = [p for p in self.positions if not (p.symbol == o.symbol and p.side == need_side)]
+                del self.positions[(o.symbol, need_side)]
+        self._refresh_exposure(o.symbol)
 
         self._append_log("成交回报", f"{o.symbol} {o.side}/{o.effect} {o.qty}手 @ {fill_price:.2f}，费 {fee:.2f}")
 
         self._risk_check_and_act("成交回报")
 
     def _append_log(self, title: str, detail: str) -> None:
-        self.round_log.append({"title": title, "detail": detail, "ts": now_str()})
-        if len(self.round_log) > 80:
-            self.round_log.pop(0)
-
-    # --------- WebSocket helpers ----------
-    def ws_register(self, ws: WebSocket) -> str:
-        cid = f"c{len(self.ws_clients)+1}"
-        self.ws_clients[cid] = ws
-        return cid
-
-    def ws_unregister(self, client_id: str) -> None:
-        if client_id in self.ws_clients:
-            del self.ws_clients[client_id]
-
-    async def ws_broadcast_state(self) -> None:
-        payload = {"type": "state", "data": self.state_payload()}
-        for cid, ws in list(self.ws_clients.items()):
-            await ws.send_json(payload)
-    
+        self.round_log.append({"title": title, "detail": detail, "ts": self._now()})
+        self._log_seq += 1
+        if self._bulk is not None and title in _RISK_TITLES:
+            # 快进期间的风控事件单独收集，公告可能早被挤出 round_log
+            self._bulk.append({"tick": self.tick, "title": title, "detail": detail})
+
+    def _now(self) -> str:
+        return self._cmd_ts or now_str()
+
+    def _touch_order(self, o: Order) -> None:
+        self._dirty_orders[o.order_id] = o
+        self._order_feed_seq += 1
+        self._order_feed.append((self._order_feed_seq, o))
+
+    def _change_marks(self) -> tuple:
+        # 改状态的操作至少会动其中一项（公告、委托、成交、tick、风控）；前后一样就是什么都没改
+        return (self._log_seq, self._order_feed_seq, self.trade_count, self.tick, self.risk_state, self.risk_msg)
+
+    # --------- Change feed helpers (WebSocket 增量推送) ----------
+    def order_changes_since(self, seq: int) -> list[Order] | None:
+        """seq 之后有变动的委托（去重，按 order_id 排序）；太旧已经滚出变更流时返回 None。"""
+        if seq >= self._order_feed_seq:
+            return []
+        if not self._order_feed or self._order_feed[0][0] > seq + 1:
+            return None
+        changed: dict[int, Order] = {}
+        for i in range(len(self._order_feed) - 1, -1, -1):
+            s, o = self._order_feed[i]
+            if s <= seq:
+                break
+            changed.setdefault(o.order_id, o)
+        return sorted(changed.values(), key=lambda o: o.order_id)
+
+    def logs_since(self, seq: int) -> list[dict]:
+        n = min(self._log_seq - seq, len(self.round_log))
+        if n <= 0:
+            return []
+        return list(islice(self.round_log, len(self.round_log) - n, None))
+
     def to_dict(self) -> dict:
-        # 注意：frontend_dir / ws_clients 不入库
+        # 注意：frontend_dir / 变更流不入库
+        d = self._core_dict()
+        if self.shared is None:
+            d["market"] = {k: self._market_dict(v) for k, v in self.market.items()}
+            d["day_klines"] = self.day_klines
+        d["orders"] = [asdict(o) for o in self.orders]
+        d["trades"] = [asdict(t) for t in self.trades]
+        return d
+
+    def _market_dict(self, m: Market) -> dict:
+        return market_row(m)
+
+    def _core_dict(self) -> dict:
+        # 账户/风控等小字段：每次落盘整体写（行情/委托/成交/日K 另按行增量写）
+        if self.shared is not None:
+            # 共享行情：specs / 行情 / 日K 归 SharedMarket 存，这里只记个模式
+            ref = {"market_mode": "shared"}
+        elif self.catalog.version is not None:
+            ref = {"catalog": self.catalog.version, "specs": {k: asdict(v) for k, v in self.specs.items()}}
+        else:
+            ref = {
+                "contract_months": list(self.contract_months),
+                "products": list(self.products),
+                "specs": {k: asdict(v) for k, v in self.specs.items()},
+            }
         return {
-            "contract_months": self.contract_months,
-            "products": self.products,
-            "specs": {k: asdict(v) for k, v in self.specs.items()},
-            "market": {k: asdict(v) for k, v in self.market.items()},
+            **ref,
             "cash": self.cash,
             "realized_pnl": self.realized_pnl,
             "fees": self.fees,
@@ -556,26 +1031,149 @@ class GameState:
             "risk_state": self.risk_state,
             "risk_msg": self.risk_msg,
             "auto_liquidate": self.auto_liquidate,
-            "positions": [asdict(p) for p in self.positions],
-            "orders": [asdict(o) for o in self.orders],
-            "trades": [asdict(t) for t in self.trades],
+            "positions": [asdict(p) for p in self.positions.values()],
             "tick": self.tick,
             "ticks_per_day": self.ticks_per_day,
-            "round_log": self.round_log,
+            "round_log": list(self.round_log),
             "_order_id": self._order_id,
-            "day_klines": self.day_klines,
+            "trades_archived": self._trades_archived,
+            "orders_floor": self._orders_floor,
+            "orders_archived": self._orders_archived,
+            "seed": self.seed,
+            "rng_epoch": self._rng_epoch,
+            "journal_seq": self._journal_seq,
         }
 
-    @classmethod
-    def from_dict(cls, d: dict, frontend_dir: Path) -> "GameState":
-        s = cls(frontend_dir=frontend_dir)
-
-        # 覆盖随机初始化的内容
-        s.contract_months = list(d.get("contract_months", s.contract_months))
-        s.products = list(d.get("products", s.products))
+    def to_delta(self) -> dict:
+        """自上次落盘以来的改动：只带被修改的行情、委托，以及新追加的成交/日K。
+
+        两次快照之间只带新命令（snapshot=False），读档时由快照 + 重放命令恢复；
+        攒够 SNAPSHOT_EVERY 条命令、整体重写、共享行情时带完整快照。
+        调用即视为已落盘；写库失败时调用方应 mark_full_rewrite()，下次整体重写。
+        """
+        # 命令在 mark_saved 之前一直留着：写失败了下次照样带上（库里按序号去重）
+        journal = list(self._journal)
+        if not self._snapshot_due(journal):
+            return {"snapshot": False, "version": self._db_version, "journal": journal}
+        full = self._full_rewrite
+        if not full:
+            # 上一次增量已经写成功（否则这次会是整体重写），之前的成交 / 委托都在库里了，可以移出内存
+            self._trim_history()
+        markets = self.market.keys() if full else self._dirty_markets
+        if self.shared is not None:
+            markets = ()
+        orders = self.orders if full else sorted(self._dirty_orders.values(), key=lambda o: o.order_id)
+        trades_from = self._trades_archived if full else self._saved_trades
+        base = self._trades_archived
+
+        klines = []
+        for sym, rows in (self.day_klines.items() if self.shared is None else ()):
+            start = 0 if full else self._saved_klines.get(sym, 0)
+            for k in rows[start:]:
+                klines.append((sym, k))
+
+        delta = {
+            "snapshot": True,
+            "journal": journal,
+            "full": full,
+            "version": self._db_version,
+            "core": self._core_dict(),
+            "markets": {sym: self._market_dict(self.market[sym]) for sym in markets if sym in self.market},
+            "orders": [asdict(o) for o in orders],
+            "trades": [(i, asdict(t)) for i, t in enumerate(self.trades[trades_from - base :], start=trades_from)],
+            "klines": klines,
+            # 归档：成交序号 < trades_floor、order_id < orders_floor 的行挪到归档表（orders_keep 是还没成交的）
+            "trades_floor": base,
+            "orders_floor": self._orders_floor,
+            "orders_keep": sorted(o.order_id for o in self.book if o.order_id < self._orders_floor),
+        }
+        self._mark_synced()
+        self._snapshot_seq, self._snapshot_tick = self._journal_seq, self.tick
+        return delta
+
+    def _snapshot_due(self, journal: list[tuple[int, dict]]) -> bool:
+        # 没有新命令却要写（重置 / 新开局之类），或者共享行情（重放不出全服行情）：只能写快照
+        if self._full_rewrite or self.shared is not None or not journal:
+            return True
+        # 重放的开销主要在 tick 上：命令条数和推进的 tick 数哪个先到都写快照
+        return max(self._journal_seq - self._snapshot_seq, self.tick - self._snapshot_tick) >= SNAPSHOT_EVERY
+
+    def _mark_synced(self) -> None:
+        self._full_rewrite = False
+        self._dirty_markets.clear()
+        self._dirty_orders.clear()
+        self._saved_trades = self.trade_count
+        self._saved_klines = {sym: len(rows) for sym, rows in self.day_klines.items()}
+
+    def mark_full_rewrite(self) -> None:
+        self._full_rewrite = True
+
+    def mark_saved(self, delta: dict) -> None:
+        """delta 已经写进库：库里的版本号跟着 +1，带上的命令不用再写。"""
+        self._db_version = delta["version"] + 1
+        if delta.get("journal"):
+            last = delta["journal"][-1][0]
+            self._journal = [e for e in self._journal if e[0] > last]
+
+    def replay(self, commands: Iterable[tuple[int, dict]]) -> None:
+        """按顺序重放命令（读档时补上快照之后的部分）；这些命令已经在库里，不再记一遍。
+
+        行情只由种子和 tick 号决定、时间戳取命令里记的，所以重放结果和当初执行的一样。
+        """
+        for seq, cmd in commands:
+            try:
+                if cmd["op"] not in JOURNAL_OPS:
+                    raise ValueError(f"unknown journal op: {cmd['op']}")
+                self._cmd_ts = cmd["ts"]
+                getattr(self, cmd["op"])(*cmd["args"])
+            except Exception as e:
+                # 坏掉的命令（未知操作、旧版本原样记下的 payload）跳过，不让整个 session 从此读不出来；
+                # 序号照样往前走，之后新记的命令不会和库里这条撞号
+                logger.warning("skip unreplayable journal command #{} {!r}: {!r}", seq, cmd, e)
+            finally:
+                self._cmd_ts = None
+            self._journal_seq = seq
+
+    def _trim_history(self) -> None:
+        # 只挪已经落过盘的：成交序号 < _saved_trades，委托不在 _dirty_orders 里
+        if len(self.trades) > 2 * TRADES_HOT:
+            floor = min(self._saved_trades, self.trade_count - TRADES_HOT)
+            drop = floor - self._trades_archived
+            if drop > 0:
+                del self.trades[:drop]
+                self._trades_archived = floor
+
+        if len(self.order_archive) > 2 * ORDERS_HOT:
+            k = len(self.order_archive) - ORDERS_HOT
+            for i in range(k):
+                if self.order_archive[i].order_id in self._dirty_orders:
+                    k = i
+                    break
+            if k > 0:
+                self._orders_floor = max(self._orders_floor, self.order_archive[k].order_id)
+                self._orders_archived += k
+                del self.order_archive[:k]
 
-        s.specs = {k: Spec(**v) for k, v in dict(d.get("specs", {})).items()}
-        s.market = {k: Market(**v) for k, v in dict(d.get("market", {})).items()}
+    @classmethod
+    def from_dict(cls, d: dict, frontend_dir: Path, shared: SharedMarket | None = None) -> "GameState":
+        # 旧存档没有种子：从读档这一刻起用一个新种子
+        s = cls(frontend_dir=frontend_dir, shared=shared, seed=d.get("seed"))
+        s._rng_epoch = int(d.get("rng_epoch", 0))
+
+        # 覆盖随机初始化的内容（共享行情模式下行情归 SharedMarket，存档里的私有行情忽略）
+        if shared is None:
+            if "catalog" in d:
+                s.catalog = get_catalog(int(d["catalog"]))
+            elif "products" in d:
+                # 旧存档：整份货品表内嵌在每个 session 里
+                s.catalog = catalog_for(d["products"], d.get("contract_months", s.contract_months))
+            s.contract_months = s.catalog.contract_months
+            s.products = s.catalog.products
+
+            # 共享模式下存的档没有行情：沿用新开的随机行情
+            if d.get("specs") and d.get("market"):
+                s.specs = {k: Spec(**v) for k, v in dict(d["specs"]).items()}
+                s.market = {k: Market(**v) for k, v in dict(d["market"]).items()}
 
         s.cash = float(d.get("cash", s.cash))
         s.realized_pnl = float(d.get("realized_pnl", s.realized_pnl))
@@ -588,18 +1186,45 @@ class GameState:
         s.risk_msg = str(d.get("risk_msg", s.risk_msg))
         s.auto_liquidate = bool(d.get("auto_liquidate", s.auto_liquidate))
 
-        s.positions = [Position(**p) for p in list(d.get("positions", []))]
-        s.orders = [Order(**o) for o in list(d.get("orders", []))]
+        s.positions = {}
+        for pd in list(d.get("positions", [])):
+            p = Position(**pd)
+            s.positions[(p.symbol, p.side)] = p
+        s._rebuild_exposure()
+        s.book = OrderBook()
+        s.order_archive = []
+        for od in list(d.get("orders", [])):
+            o = Order(**od)
+            if o.status == "new":
+                s.book.add(o)
+            else:
+                s._archive_order(o)
         s.trades = [Trade(**t) for t in list(d.get("trades", []))]
+        s._trades_archived = int(d.get("trades_archived", 0))
+        s._orders_floor = int(d.get("orders_floor", 0))
+        s._orders_archived = int(d.get("orders_archived", 0))
 
         s.tick = int(d.get("tick", 0))
-        s.ticks_per_day = int(d.get("ticks_per_day", s.ticks_per_day))
-        s.round_log = list(d.get("round_log", []))
+        s.round_log = deque(d.get("round_log", []), maxlen=ROUND_LOG_CAP)
         s._order_id = int(d.get("_order_id", 1000))
-        s.day_klines = dict(d.get("day_klines", {}))
-
-        # ws_clients 永远是内存态
-        s.ws_clients = {}
+        if shared is None:
+            s.ticks_per_day = int(d.get("ticks_per_day", s.ticks_per_day))
+            if d.get("market"):
+                s.day_klines = dict(d.get("day_klines", {}))
+
+        s._db_version = int(d.get("db_version", 0))
+        # 从按行存储的存档恢复：库里已经是最新的，不用整体重写
+        if d.get("storage") == "rows":
+            s._mark_synced()
+        s._journal_seq = s._snapshot_seq = int(d.get("journal_seq", 0))
+        s._snapshot_tick = s.tick
+        tail = d.get("journal_tail")
+        if tail:
+            if shared is None:
+                # 快照之后的命令：重放出来的改动算作还没写进快照，下次快照一起写
+                s.replay(tail)
+            else:
+                logger.warning("skip replaying {} journal command(s) in shared market mode", len(tail))
 
         return s
     # --------- Reset helpers ----------
@@ -611,28 +1236,38 @@ class GameState:
         self.risk_state = "NORMAL"
         self.risk_msg = ""
 
-        self.positions = []
-        self.orders = []
+        self.positions = {}
+        self._rebuild_exposure()
+        self.book.clear()
+        self.order_archive = []
         self.trades = []
-        self.round_log = []
+        self.round_log.clear()
 
         self._order_id = 1000
+        self._full_rewrite = True
 
         self._append_log("重置", "已重置玩家账户/持仓/委托/成交")
 
 
     def reset_market(self) -> None:
-        self.market = {}
-        for p in self.products:
-            code = p["code"]
-            for ym in self.contract_months:
-                symbol = f"{code}{ym}"
-                self.market[symbol] = init_market(symbol=symbol, code=code, spec=self.specs[code])
+        if self.shared is None:
+            # 换一组随机流，重置后的行情不会重演上一轮
+            self._rng_epoch += 1
+            rng = self._rng("init")
+            self.market = {}
+            for p in self.products:
+                code = p["code"]
+                for ym in self.contract_months:
+                    symbol = f"{code}{ym}"
+                    self.market[symbol] = init_market(symbol=symbol, code=code, spec=self.specs[code], rng=rng)
+        self._rebuild_exposure()
 
         # 市场重置后，旧委托/成交/日志清掉，避免穿越
-        self.orders = []
+        self.book.clear()
+        self.order_archive = []
         self.trades = []
-        self.round_log = []
+        self.round_log.clear()
+        self._full_rewrite = True
 
         self._append_log("重置", "已重置市场行情并清空委托/成交")
 
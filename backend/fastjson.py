@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import json
+import math
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:  # orjson 是可选依赖：pip install "endfield-futures[fast]"
+    import orjson
+except ImportError:  # pragma: no cover - 没装就退回标准库
+    orjson = None
+
+# /api 路由用的 JSON 响应：有 orjson 就用 orjson 直接编码成 bytes，
+# 并且支持把预先编码好的片段（fragment）原样拼进去，不再逐层解析再编码。
+
+
+def available() -> bool:
+    return orjson is not None
+
+
+def dumps(obj: Any) -> bytes:
+    # inf / nan（比如没有持仓时的维持率）编码成 null，和 FastAPI 默认行为一致，浏览器也能 JSON.parse
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(_finite(obj), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _finite(obj: Any) -> Any:
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: _finite(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(v) for v in obj]
+    return obj
+
+
+def fragment(obj: Any) -> Any:
+    """预编码的 JSON 片段；没有 orjson 时原样返回对象（由标准库照常编码）。"""
+    if orjson is not None:
+        return orjson.Fragment(orjson.dumps(obj))
+    return obj
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
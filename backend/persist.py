@@ -1,22 +1,33 @@
 from __future__ import annotations
 
 import json
+import os
 import sqlite3
+import threading
 import time
 from pathlib import Path
+from typing import Iterable
 
-from loguru import logger
+from backend import codec
+
+try:  # 只有 POSIX 有 fcntl；Windows 上不做多进程检查（见 claim_db）
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
 
 
 def _db_path() -> Path:
+    override = os.environ.get("ENDFIELD_DB_PATH")
+    if override:
+        return Path(override).resolve()
     # 放在项目根目录下（你也可以改成 backend/ 下）
     return (Path(__file__).resolve().parents[1] / "data").resolve() / "save.sqlite3"
 
 
-def _connect() -> sqlite3.Connection:
+def _open() -> sqlite3.Connection:
     path = _db_path()
     path.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(str(path), check_same_thread=False)
+    conn = sqlite3.connect(str(path), check_same_thread=False, cached_statements=64)
     conn.row_factory = sqlite3.Row
     # 并发友好一点
     conn.execute("PRAGMA journal_mode=WAL;")
@@ -24,61 +35,424 @@ def _connect() -> sqlite3.Connection:
     return conn
 
 
+class _ConnectionPool:
+    """每个线程一条长连接：pragma 只在打开时跑一次，语句走 sqlite3 自带的预编译缓存。"""
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all: list[sqlite3.Connection] = []
+
+    def get(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = _open()
+            self._local.conn = conn
+            with self._lock:
+                self._all.append(conn)
+        return conn
+
+    def close_all(self) -> None:
+        with self._lock:
+            conns, self._all = self._all, []
+        for conn in conns:
+            conn.close()
+        self._local = threading.local()
+
+
+_pool = _ConnectionPool()
+
+
+def _connect() -> sqlite3.Connection:
+    return _pool.get()
+
+
+def close_db() -> None:
+    _pool.close_all()
+    release_db()
+
+
+class DatabaseBusy(RuntimeError):
+    """库已经被别的进程以不兼容的落盘模式占用。"""
+
+
+_claim = None
+
+
+def claim_db(exclusive: bool) -> None:
+    """声明本进程要长期缓存 session 并写这个库（服务进程启动时调用一次，close_db 时释放）。
+
+    非 sync 落盘时请求先返回、过一会儿才写库，另一个进程在这期间写了同一个 session，
+    这边已经答应过客户端的改动就只能丢掉（版本冲突）。所以非 sync 只允许一个进程用这个库（exclusive=True），
+    多进程（多 worker / 分片）必须全部用 sync，冲突时当场 409。用库旁边的锁文件 flock 实现，进程退出自动释放。
+    """
+    global _claim
+    if fcntl is None or _claim is not None:
+        return
+    path = _db_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    f = open(path.with_name(path.name + ".lock"), "a+")
+    try:
+        fcntl.flock(f, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        raise DatabaseBusy(
+            f"{path} is in use by another process; running several processes on one database "
+            "requires ENDFIELD_DURABILITY=sync in all of them"
+        ) from None
+    _claim = f
+
+
+def release_db() -> None:
+    global _claim
+    if _claim is not None:
+        _claim.close()
+        _claim = None
+
+
+_SQL_LOAD = "SELECT state_json, version FROM sessions WHERE session_id = ?"
+# 带版本号的写（compare-and-swap）：库里的 version 和读出来时一样才写，写完 +1；
+# 不一样说明别的进程在这期间写过，这次不写（见 save_many）
+_SQL_SAVE_CORE = """
+    INSERT INTO sessions(session_id, state_json, created_at, updated_at, version)
+    VALUES(?, ?, ?, ?, 1)
+    ON CONFLICT(session_id) DO UPDATE SET
+      state_json=excluded.state_json,
+      updated_at=excluded.updated_at,
+      version=sessions.version + 1
+    WHERE sessions.version = ?
+"""
+# 两次快照之间只追加命令：版本号照样 compare-and-swap +1，快照本身不动
+_SQL_BUMP_VERSION = "UPDATE sessions SET updated_at = ?, version = version + 1 WHERE session_id = ? AND version = ?"
+_SQL_DELETE = "DELETE FROM sessions WHERE session_id = ?"
+
+# 按行存储：行情按合约 upsert，委托按 order_id upsert，成交 / 日K 只追加
+_ROW_TABLES = ("session_markets", "session_orders", "session_trades", "session_klines")
+_SQL_UPSERT_MARKET = """
+    INSERT INTO session_markets(session_id, symbol, data) VALUES(?, ?, ?)
+    ON CONFLICT(session_id, symbol) DO UPDATE SET data=excluded.data
+"""
+_SQL_UPSERT_ORDER = """
+    INSERT INTO session_orders(session_id, order_id, data) VALUES(?, ?, ?)
+    ON CONFLICT(session_id, order_id) DO UPDATE SET data=excluded.data
+"""
+_SQL_APPEND_TRADE = "INSERT OR REPLACE INTO session_trades(session_id, seq, data) VALUES(?, ?, ?)"
+_SQL_APPEND_KLINE = "INSERT OR REPLACE INTO session_klines(session_id, symbol, day, data) VALUES(?, ?, ?, ?)"
+
+# 归档：移出内存窗口的成交 / 已结束委托从按行表挪到归档表，加载时不再读它们。
+# 委托用 REPLACE：压在下限以下、挂了很久才成交的委托，归档里要以最后写进来的状态为准
+_ARCHIVE_TABLES = ("archive_trades", "archive_orders")
+_SQL_ARCHIVE_TRADES = """
+    INSERT OR IGNORE INTO archive_trades(session_id, seq, data)
+    SELECT session_id, seq, data FROM session_trades WHERE session_id = ? AND seq < ?
+"""
+_SQL_DROP_TRADES = "DELETE FROM session_trades WHERE session_id = ? AND seq < ?"
+_SQL_ARCHIVE_ORDERS = """
+    INSERT OR REPLACE INTO archive_orders(session_id, order_id, data)
+    SELECT session_id, order_id, data FROM session_orders
+    WHERE session_id = ? AND order_id < ? AND order_id NOT IN (SELECT value FROM json_each(?))
+"""
+_SQL_DROP_ORDERS = """
+    DELETE FROM session_orders
+    WHERE session_id = ? AND order_id < ? AND order_id NOT IN (SELECT value FROM json_each(?))
+"""
+
+# 命令日志：每个 session 按序号只追加（重复写同一序号忽略）；读档时重放快照之后的部分
+_SQL_APPEND_JOURNAL = "INSERT OR IGNORE INTO session_journal(session_id, seq, data) VALUES(?, ?, ?)"
+_SQL_PRUNE_JOURNAL = "DELETE FROM session_journal WHERE session_id = ? AND seq <= ?"
+# 写快照时保留快照之前多少条命令（审计 / 从头重放用）：默认 0，快照已经包含的命令随快照一起删掉，
+# 表的大小只和快照间隔有关；< 0 全部保留（会一直涨，只在需要审计时打开）
+JOURNAL_RETAIN = int(os.environ.get("ENDFIELD_JOURNAL_RETAIN", "0"))
+
+# 共享行情（ENDFIELD_MARKET_MODE=shared）整份存一行
+_SQL_LOAD_SHARED = "SELECT data FROM shared_markets WHERE name = ?"
+_SQL_UPSERT_SHARED = """
+    INSERT INTO shared_markets(name, data, updated_at) VALUES(?, ?, ?)
+    ON CONFLICT(name) DO UPDATE SET data=excluded.data, updated_at=excluded.updated_at
+"""
+
+
 def init_db() -> None:
     conn = _connect()
-    try:
+    with conn:
         conn.execute(
             """
             CREATE TABLE IF NOT EXISTS sessions (
               session_id TEXT PRIMARY KEY,
               state_json TEXT NOT NULL,
               created_at INTEGER NOT NULL,
+              updated_at INTEGER NOT NULL,
+              version INTEGER NOT NULL DEFAULT 0
+            );
+            """
+        )
+        # 旧库没有 version 列：补上，已有的行从 0 算起
+        cols = {r["name"] for r in conn.execute("PRAGMA table_info(sessions)")}
+        if "version" not in cols:
+            conn.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS session_markets (
+              session_id TEXT NOT NULL,
+              symbol TEXT NOT NULL,
+              data TEXT NOT NULL,
+              PRIMARY KEY (session_id, symbol)
+            ) WITHOUT ROWID;
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS session_orders (
+              session_id TEXT NOT NULL,
+              order_id INTEGER NOT NULL,
+              data TEXT NOT NULL,
+              PRIMARY KEY (session_id, order_id)
+            ) WITHOUT ROWID;
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS session_trades (
+              session_id TEXT NOT NULL,
+              seq INTEGER NOT NULL,
+              data TEXT NOT NULL,
+              PRIMARY KEY (session_id, seq)
+            ) WITHOUT ROWID;
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS session_klines (
+              session_id TEXT NOT NULL,
+              symbol TEXT NOT NULL,
+              day INTEGER NOT NULL,
+              data TEXT NOT NULL,
+              PRIMARY KEY (session_id, symbol, day)
+            ) WITHOUT ROWID;
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS archive_trades (
+              session_id TEXT NOT NULL,
+              seq INTEGER NOT NULL,
+              data TEXT NOT NULL,
+              PRIMARY KEY (session_id, seq)
+            ) WITHOUT ROWID;
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS archive_orders (
+              session_id TEXT NOT NULL,
+              order_id INTEGER NOT NULL,
+              data TEXT NOT NULL,
+              PRIMARY KEY (session_id, order_id)
+            ) WITHOUT ROWID;
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS session_journal (
+              session_id TEXT NOT NULL,
+              seq INTEGER NOT NULL,
+              data TEXT NOT NULL,
+              PRIMARY KEY (session_id, seq)
+            ) WITHOUT ROWID;
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS shared_markets (
+              name TEXT PRIMARY KEY,
+              data TEXT NOT NULL,
               updated_at INTEGER NOT NULL
             );
             """
         )
-        conn.commit()
-    finally:
-        conn.close()
 
 
-def load_state_json(session_id: str) -> str | None:
+def _dumps(d: object) -> bytes:
+    # 存进 TEXT 列的是 codec 的二进制（SQLite 按 BLOB 原样保存）；旧版 JSON 文本读的时候自动识别
+    return codec.encode(d)
+
+
+def load_session(session_id: str) -> dict | None:
+    """读出完整的 GameState 字典（GameState.from_dict 的输入）。
+
+    旧版存档整包放在 state_json 里；新版只在 state_json 放账户等小字段，其余按行拼回来。
+    db_version 是读出时这一行的版本号，写回时拿来做 compare-and-swap；
+    journal_tail 是快照之后追加的命令，由 from_dict 重放。
+    """
     conn = _connect()
-    try:
-        row = conn.execute(
-            "SELECT state_json FROM sessions WHERE session_id = ?",
-            (session_id,),
-        ).fetchone()
-        if row is None:
-            return None
-        return str(row["state_json"])
-    finally:
-        conn.close()
-
-
-def save_state_json(session_id: str, state_json: str) -> None:
+    row = conn.execute(_SQL_LOAD, (session_id,)).fetchone()
+    if row is None:
+        return None
+    d = codec.decode(row["state_json"])
+    d["db_version"] = row["version"]
+    if "market" in d:
+        return d
+
+    d["market"] = {
+        r["symbol"]: codec.decode(r["data"])
+        for r in conn.execute("SELECT symbol, data FROM session_markets WHERE session_id = ?", (session_id,))
+    }
+    d["orders"] = [
+        codec.decode(r["data"])
+        for r in conn.execute(
+            "SELECT data FROM session_orders WHERE session_id = ? ORDER BY order_id", (session_id,)
+        )
+    ]
+    d["trades"] = [
+        codec.decode(r["data"])
+        for r in conn.execute("SELECT data FROM session_trades WHERE session_id = ? ORDER BY seq", (session_id,))
+    ]
+    klines: dict[str, list[dict]] = {sym: [] for sym in d["market"]}
+    for r in conn.execute(
+        "SELECT symbol, data FROM session_klines WHERE session_id = ? ORDER BY symbol, day", (session_id,)
+    ):
+        klines.setdefault(r["symbol"], []).append(codec.decode(r["data"]))
+    d["day_klines"] = klines
+    d["storage"] = "rows"
+    d["journal_tail"] = load_journal(session_id, after=int(d.get("journal_seq", 0)))
+    return d
+
+
+def load_journal(session_id: str, after: int = 0, limit: int | None = None) -> list[tuple[int, dict]]:
+    """序号 > after 的命令，按序号升序：[(seq, {"op", "args", "ts"}), ...]。"""
+    rows = _connect().execute(
+        "SELECT seq, data FROM session_journal WHERE session_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+        (session_id, after, -1 if limit is None else limit),
+    ).fetchall()
+    return [(r["seq"], codec.decode(r["data"])) for r in rows]
+
+
+def _write_delta(conn: sqlite3.Connection, session_id: str, delta: dict, now: int) -> bool:
+    # 先过版本检查，不通过就什么都不写
+    if not delta.get("snapshot", True):
+        cur = conn.execute(_SQL_BUMP_VERSION, (now, session_id, delta["version"]))
+        if cur.rowcount == 0:
+            return False
+        _append_journal(conn, session_id, delta["journal"])
+        return True
+    cur = conn.execute(_SQL_SAVE_CORE, (session_id, _dumps(delta["core"]), now, now, delta.get("version", 0)))
+    if cur.rowcount == 0:
+        return False
+    _append_journal(conn, session_id, delta.get("journal", ()))
+    if JOURNAL_RETAIN >= 0:
+        conn.execute(_SQL_PRUNE_JOURNAL, (session_id, delta["core"].get("journal_seq", 0) - JOURNAL_RETAIN))
+    if delta["full"]:
+        # 整体重写前先归档：移出内存的行此时还在按行表里，不能先被删掉
+        _archive(conn, session_id, delta)
+        for table in _ROW_TABLES:
+            conn.execute(f"DELETE FROM {table} WHERE session_id = ?", (session_id,))
+    conn.executemany(
+        _SQL_UPSERT_MARKET,
+        [(session_id, sym, _dumps(m)) for sym, m in delta["markets"].items()],
+    )
+    conn.executemany(
+        _SQL_UPSERT_ORDER,
+        [(session_id, o["order_id"], _dumps(o)) for o in delta["orders"]],
+    )
+    conn.executemany(
+        _SQL_APPEND_TRADE,
+        [(session_id, seq, _dumps(t)) for seq, t in delta["trades"]],
+    )
+    conn.executemany(
+        _SQL_APPEND_KLINE,
+        [(session_id, sym, k["day"], _dumps(k)) for sym, k in delta["klines"]],
+    )
+    # 归档放在 upsert 之后：这一批里刚成交的旧委托先写成最新状态，再被挪走
+    _archive(conn, session_id, delta)
+    return True
+
+
+def _append_journal(conn: sqlite3.Connection, session_id: str, journal: Iterable[tuple[int, dict]]) -> None:
+    conn.executemany(_SQL_APPEND_JOURNAL, [(session_id, seq, _dumps(cmd)) for seq, cmd in journal])
+
+
+def _archive(conn: sqlite3.Connection, session_id: str, delta: dict) -> None:
+    # 下限只增不减，重复执行无副作用（写失败回滚后下次照样能挪）
+    trades_floor = delta.get("trades_floor", 0)
+    if trades_floor > 0:
+        conn.execute(_SQL_ARCHIVE_TRADES, (session_id, trades_floor))
+        conn.execute(_SQL_DROP_TRADES, (session_id, trades_floor))
+    orders_floor = delta.get("orders_floor", 0)
+    if orders_floor > 0:
+        keep = json.dumps(delta.get("orders_keep", []))
+        conn.execute(_SQL_ARCHIVE_ORDERS, (session_id, orders_floor, keep))
+        conn.execute(_SQL_DROP_ORDERS, (session_id, orders_floor, keep))
+
+
+def save_many(sessions: Iterable[tuple[str, dict]]) -> list[str]:
+    """一个事务里批量写入多个 session 的增量（GameState.to_delta 的输出：完整快照，或只有新命令）。
+
+    delta["version"] 和库里的版本号对不上的 session 跳过不写（其余照常提交），返回它们的 session_id。
+    """
+    items = list(sessions)
+    if not items:
+        return []
     now = int(time.time())
     conn = _connect()
-    try:
-        conn.execute(
-            """
-            INSERT INTO sessions(session_id, state_json, created_at, updated_at)
-            VALUES(?, ?, ?, ?)
-            ON CONFLICT(session_id) DO UPDATE SET
-              state_json=excluded.state_json,
-              updated_at=excluded.updated_at
-            """,
-            (session_id, state_json, now, now),
-        )
-        conn.commit()
-    finally:
-        conn.close()
+    conflicts = []
+    with conn:
+        for sid, delta in items:
+            if not _write_delta(conn, sid, delta, now):
+                conflicts.append(sid)
+    return conflicts
 
 
 def delete_session(session_id: str) -> None:
     conn = _connect()
-    try:
-        conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
-        conn.commit()
-    finally:
-        conn.close()
+    with conn:
+        conn.execute(_SQL_DELETE, (session_id,))
+        for table in (*_ROW_TABLES, *_ARCHIVE_TABLES, "session_journal"):
+            conn.execute(f"DELETE FROM {table} WHERE session_id = ?", (session_id,))
+
+
+def load_trade_history(session_id: str, before: int, limit: int) -> list[tuple[int, dict]]:
+    """成交序号（从 0 起）< before 的最后 limit 笔，按序号升序。
+
+    刚移出内存、还没等到下次写库挪走的行仍在 session_trades 里，所以两张表一起查。
+    """
+    rows = _connect().execute(
+        """
+        SELECT seq, data FROM (
+          SELECT seq, data FROM archive_trades WHERE session_id = ? AND seq < ?
+          UNION ALL
+          SELECT seq, data FROM session_trades WHERE session_id = ? AND seq < ?
+        ) ORDER BY seq DESC LIMIT ?
+        """,
+        (session_id, before, session_id, before, limit),
+    ).fetchall()
+    return [(r["seq"], codec.decode(r["data"])) for r in reversed(rows)]
+
+
+def load_order_history(session_id: str, before: int, limit: int, exclude: Iterable[int] = ()) -> list[dict]:
+    """order_id < before 的最后 limit 条委托（exclude 里的跳过，一般是内存里还活着的委托），按 order_id 升序。"""
+    skip = json.dumps(sorted(exclude))
+    rows = _connect().execute(
+        """
+        SELECT order_id, data FROM (
+          SELECT order_id, data FROM archive_orders WHERE session_id = ? AND order_id < ?
+          UNION ALL
+          SELECT order_id, data FROM session_orders WHERE session_id = ? AND order_id < ?
+        ) WHERE order_id NOT IN (SELECT value FROM json_each(?))
+        ORDER BY order_id DESC LIMIT ?
+        """,
+        (session_id, before, session_id, before, skip, limit),
+    ).fetchall()
+    return [codec.decode(r["data"]) for r in reversed(rows)]
+
+
+def load_shared_market(name: str = "main") -> dict | None:
+    row = _connect().execute(_SQL_LOAD_SHARED, (name,)).fetchone()
+    if row is None:
+        return None
+    return codec.decode(row["data"])
+
+
+def save_shared_market(d: dict, name: str = "main") -> None:
+    conn = _connect()
+    with conn:
+        conn.execute(_SQL_UPSERT_SHARED, (name, _dumps(d), int(time.time())))
@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import hashlib
+import importlib
+import itertools
+import multiprocessing
+import os
+import pickle
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+from loguru import logger
+
+# 多进程分片：session 按一致性哈希固定分给 N 个 worker 进程，每个 worker 自己持有名下 session 的
+# GameState（自己的 SessionCache / 写队列），模拟跑满各自的 CPU 核，不再挤同一个 GIL。
+# 前端进程只做路由：把 (操作名, 参数) 通过 Pipe 发给所属 worker，等回包。
+#
+# worker 启动时导入 module，调用 module.shard_worker_start()，之后按名字执行 module.SHARD_OPS 里的函数；
+# 退出前调用 module.shard_worker_stop()。worker 里可以用 push() 给前端进程的订阅者推消息。
+#
+# 协议（都是 pickle 过的元组）：
+#   前端 -> worker   (req_id, 操作名, args)；None 表示退出
+#   worker -> 前端   ("ok", req_id, 结果) / ("err", req_id, 异常) / ("push", token, 消息)
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """一致性哈希环：每个节点放 vnodes 个虚拟点，增减节点时只有约 1/N 的 key 换主人。"""
+
+    def __init__(self, nodes: list[str], vnodes: int = 64) -> None:
+        if not nodes:
+            raise ValueError("hash ring needs at least one node")
+        points = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(vnodes))
+        self._keys = [h for h, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node(self, key: str) -> str:
+        i = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._nodes[i]
+
+
+class RemoteError(RuntimeError):
+    """worker 里抛出的异常带不回来（不能 pickle）时，换成这个，消息里是原异常的 repr。"""
+
+
+class _Shard:
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.name = f"shard{index}"
+        self.conn = None
+        self.process = None
+        self.reader: threading.Thread | None = None
+        # Connection 不是线程安全的：发送串行，接收只在 reader 线程里
+        self.send_lock = threading.Lock()
+        self.pending: dict[int, Future] = {}
+        self.pending_lock = threading.Lock()
+
+
+class ShardPool:
+    def __init__(self, size: int, module: str, threads: int = 8, vnodes: int = 64) -> None:
+        if size < 1:
+            raise ValueError("shard pool needs at least one worker")
+        self.size = size
+        self.module = module
+        # worker 里执行操作的线程数：CPU 活在 GIL 下串行，多几个线程只是为了读库时不堵别的 session
+        self.threads = threads
+        self._shards = [_Shard(i) for i in range(size)]
+        self._ring = HashRing([s.name for s in self._shards], vnodes)
+        self._by_name = {s.name: s for s in self._shards}
+        self._ids = itertools.count(1)
+        # 前端进程里的推送接收方：token -> 回调（在 reader 线程里调用）
+        self._subs: dict[int, Callable[[Any], None]] = {}
+        self._started = False
+
+    @classmethod
+    def from_env(cls, module: str) -> "ShardPool | None":
+        size = int(os.environ.get("ENDFIELD_SHARDS", "0"))
+        if size <= 1:
+            return None
+        return cls(size, module, threads=int(os.environ.get("ENDFIELD_SHARD_THREADS", "8")))
+
+    def names(self) -> list[str]:
+        return [s.name for s in self._shards]
+
+    def shard_of(self, session_id: str) -> str:
+        return self._ring.node(session_id)
+
+    def start(self) -> None:
+        if self._started:
+            return
+        # spawn：不从前端进程 fork 线程 / SQLite 连接 / 事件循环，worker 干净地重新导入
+        ctx = multiprocessing.get_context("spawn")
+        for shard in self._shards:
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(
+                target=_worker_main,
+                args=(shard.index, child, self.module, self.threads),
+                name=f"endfield-{shard.name}",
+                daemon=True,
+            )
+            proc.start()
+            child.close()
+            shard.conn, shard.process = parent, proc
+            shard.reader = threading.Thread(target=self._read, args=(shard,), name=f"{shard.name}-reader", daemon=True)
+            shard.reader.start()
+        self._started = True
+        logger.info("started {} shard workers", self.size)
+
+    def stop(self, timeout: float = 30.0) -> None:
+        if not self._started:
+            return
+        for shard in self._shards:
+            try:
+                with shard.send_lock:
+                    shard.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        # worker 收到 None 后把手上的操作做完、写队列落盘再退出
+        for shard in self._shards:
+            shard.process.join(timeout)
+            if shard.process.is_alive():
+                logger.warning("{} did not exit in {}s, terminating", shard.name, timeout)
+                shard.process.terminate()
+                shard.process.join()
+            shard.reader.join()
+            shard.conn.close()
+        self._started = False
+
+    def submit(self, shard_name: str, op: str, *args: Any) -> Future:
+        shard = self._by_name[shard_name]
+        fut: Future = Future()
+        req_id = next(self._ids)
+        with shard.pending_lock:
+            shard.pending[req_id] = fut
+        try:
+            with shard.send_lock:
+                shard.conn.send((req_id, op, args))
+        except Exception as e:
+            with shard.pending_lock:
+                shard.pending.pop(req_id, None)
+            fut.set_exception(e)
+        return fut
+
+    async def call(self, session_id: str, op: str, *args: Any) -> Any:
+        return await asyncio.wrap_future(self.submit(self.shard_of(session_id), op, *args))
+
+    def broadcast(self, op: str, *args: Any, shards: list[str] | None = None) -> list:
+        # 先全部发出去再逐个等：各 worker 并行跑，耗时取最慢的那个
+        futs = [self.submit(name, op, *args) for name in (shards or self.names())]
+        return [f.result() for f in futs]
+
+    def subscribe(self, deliver: Callable[[Any], None]) -> int:
+        token = next(self._ids)
+        self._subs[token] = deliver
+        return token
+
+    def unsubscribe(self, token: int) -> None:
+        self._subs.pop(token, None)
+
+    def _read(self, shard: _Shard) -> None:
+        while True:
+            try:
+                kind, key, value = shard.conn.recv()
+            except (EOFError, OSError):
+                break
+            except Exception:
+                # 回包解不开（比如异常类型在前端进程里不认识）：只能丢掉这一条
+                logger.exception("{} sent an unreadable message", shard.name)
+                continue
+            if kind == "push":
+                deliver = self._subs.get(key)
+                if deliver is not None:
+                    deliver(value)
+                continue
+            with shard.pending_lock:
+                fut = shard.pending.pop(key, None)
+            if fut is None:
+                continue
+            if kind == "ok":
+                fut.set_result(value)
+            else:
+                fut.set_exception(value)
+        # worker 没了：还在等的请求全部失败，不让调用方一直挂着
+        with shard.pending_lock:
+            pending, shard.pending = shard.pending, {}
+        if pending and self._started:
+            logger.error("{} exited with {} request(s) in flight", shard.name, len(pending))
+        for fut in pending.values():
+            fut.set_exception(RemoteError(f"{shard.name} exited"))
+
+
+# ---- worker 进程 ----
+
+_conn = None
+_send_lock = threading.Lock()
+
+
+def push(token: int, msg: Any) -> None:
+    """worker 里调用：把消息推给前端进程里 token 对应的订阅者。"""
+    with _send_lock:
+        _conn.send(("push", token, msg))
+
+
+def _reply(kind: str, req_id: int, value: Any) -> None:
+    with _send_lock:
+        _conn.send((kind, req_id, value))
+
+
+def _run(ops: dict[str, Callable[..., Any]], req_id: int, op: str, args: tuple) -> None:
+    try:
+        result = ops[op](*args)
+    except Exception as e:
+        try:
+            # 要在前端进程里能还原出来才原样带回（400 / 404 / 409 这些靠异常类型映射）
+            pickle.loads(pickle.dumps(e))
+        except Exception:
+            e = RemoteError(repr(e))
+        _reply("err", req_id, e)
+        return
+    try:
+        _reply("ok", req_id, result)
+    except Exception as e:
+        _reply("err", req_id, RemoteError(f"{op} returned an unpicklable result: {e!r}"))
+
+
+def _worker_main(index: int, conn, module: str, threads: int) -> None:
+    global _conn
+    _conn = conn
+    # 模块据此知道自己在 worker 里（不再起分片、不起时钟）
+    os.environ["ENDFIELD_SHARD_WORKER"] = str(index)
+    mod = importlib.import_module(module)
+    ops = mod.SHARD_OPS
+    mod.shard_worker_start()
+    executor = ThreadPoolExecutor(threads, thread_name_prefix=f"shard{index}")
+    try:
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                break
+            if msg is None:
+                break
+            executor.submit(_run, ops, *msg)
+    finally:
+        executor.shutdown(wait=True)
+        mod.shard_worker_stop()
+        conn.close()
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from typing import Callable
+
+from backend.engine.state import GameState
+
+# WebSocket 推送：连上先发一次全量 snapshot，之后每次状态变化只发增量 delta。
+# 每条消息带 seq（每个连接从 1 开始连续递增），前端发现断号就请求 resync 重新拿 snapshot。
+#
+# delta 里只出现有变化的部分：
+#   market      {symbol: {变动的标量字段..., "append": [新增分时点]}}（落后太多时给 "series" 全量）
+#   trades      新增成交
+#   orders      有变动的委托（按 order_id upsert）；落后太多时给 orders_full 全量
+#   positions   持仓有变化时给全量（持仓本来就少）
+#   account     变动的账户字段
+#   round_log   新增公告
+#   day_klines  {symbol: [新增日K]}
+
+
+class StateCursor:
+    """记住某个连接已经拿到了哪些数据，据此算出下一条增量。"""
+
+    def __init__(self) -> None:
+        self.seq = 0
+        self._state: GameState | None = None
+        self._market: dict[str, dict] = {}
+        self._series: dict[str, int] = {}
+        self._trades = 0
+        self._order_seq = 0
+        self._log_seq = 0
+        self._positions: list[dict] = []
+        self._account: dict = {}
+        self._klines: dict[str, int] = {}
+
+    def snapshot(self, gs: GameState) -> dict:
+        data = gs.state_payload()
+        self._state = gs
+        self._market = {sym: _scalars(m) for sym, m in data["market"].items()}
+        self._series = {sym: gs.market[sym].series.appended for sym in data["market"]}
+        self._trades = gs.trade_count
+        self._order_seq = gs._order_feed_seq
+        self._log_seq = gs._log_seq
+        self._positions = data["positions"]
+        self._account = dict(data["account"])
+        # 只跟踪 snapshot 里给过的合约（默认主力月），其它月份的日K 不推
+        self._klines = {sym: len(rows) for sym, rows in data["day_klines"].items()}
+        self.seq += 1
+        return {"type": "snapshot", "seq": self.seq, "data": data}
+
+    def delta(self, gs: GameState) -> dict | None:
+        if gs is not self._state:
+            # 删档重开 / 换了一个 GameState：增量没意义，直接全量
+            return self.snapshot(gs)
+
+        msg: dict = {}
+
+        market = {}
+        for sym, prev in self._market.items():
+            m = gs.market[sym]
+            cur = gs._market_scalars(m)
+            changed = {k: v for k, v in cur.items() if prev.get(k) != v}
+            new_points = m.series.appended - self._series[sym]
+            if new_points > len(m.series):
+                changed["series"] = m.series.tolist()
+            elif new_points > 0:
+                changed["append"] = m.series.tolist(new_points)
+            if changed:
+                market[sym] = changed
+                prev.update(cur)
+                self._series[sym] = m.series.appended
+        if market:
+            msg["market"] = market
+
+        if gs.trade_count > self._trades:
+            # 按累计序号算新增；落后到已经移出内存的部分就只补内存里还有的
+            start = max(0, self._trades - gs._trades_archived)
+            msg["trades"] = [gs._trade_payload(t) for t in gs.trades[start:]]
+            self._trades = gs.trade_count
+
+        orders = gs.order_changes_since(self._order_seq)
+        if orders is None:
+            msg["orders_full"] = [gs._order_payload(o) for o in gs.orders]
+        elif orders:
+            msg["orders"] = [gs._order_payload(o) for o in orders]
+        self._order_seq = gs._order_feed_seq
+
+        logs = gs.logs_since(self._log_seq)
+        if logs:
+            msg["round_log"] = logs
+        self._log_seq = gs._log_seq
+
+        positions = [gs._position_payload(p) for p in gs.positions.values()]
+        if positions != self._positions:
+            msg["positions"] = positions
+            self._positions = positions
+
+        account = gs._account_payload()
+        changed = {k: v for k, v in account.items() if self._account.get(k) != v}
+        if changed:
+            msg["account"] = changed
+            self._account.update(changed)
+
+        klines = {}
+        for sym, seen in self._klines.items():
+            rows = gs.day_klines.get(sym, [])
+            if len(rows) > seen:
+                klines[sym] = rows[seen:]
+                self._klines[sym] = len(rows)
+        if klines:
+            msg["day_klines"] = klines
+
+        if not msg:
+            return None
+        self.seq += 1
+        msg["type"] = "delta"
+        msg["seq"] = self.seq
+        return msg
+
+
+def _scalars(m: dict) -> dict:
+    return {k: v for k, v in m.items() if k != "series"}
+
+
+@dataclass(eq=False)
+class Subscriber:
+    session_id: str
+    loop: asyncio.AbstractEventLoop | None
+    queue: asyncio.Queue = field(default_factory=asyncio.Queue)
+    cursor: StateCursor = field(default_factory=StateCursor)
+    # 分片 worker 里的订阅者没有事件循环，消息直接交给 forward（转发回前端进程）
+    forward: Callable[[dict], None] | None = None
+
+    def deliver(self, msg: dict) -> None:
+        if self.forward is not None:
+            self.forward(msg)
+        else:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, msg)
+
+
+class StreamHub:
+    """session_id -> 订阅者。publish 在持有 session 锁的请求线程里调用，发送交给事件循环。"""
+
+    def __init__(self) -> None:
+        self._subs: dict[str, set[Subscriber]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, session_id: str, forward: Callable[[dict], None] | None = None) -> Subscriber:
+        loop = asyncio.get_running_loop() if forward is None else None
+        sub = Subscriber(session_id=session_id, loop=loop, forward=forward)
+        with self._lock:
+            self._subs.setdefault(session_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        with self._lock:
+            subs = self._subs.get(sub.session_id)
+            if subs is None:
+                return
+            subs.discard(sub)
+            if not subs:
+                del self._subs[sub.session_id]
+
+    def has_subscribers(self, session_id: str) -> bool:
+        return session_id in self._subs
+
+    def session_ids(self) -> list[str]:
+        with self._lock:
+            return list(self._subs)
+
+    def publish(self, session_id: str, gs: GameState) -> None:
+        with self._lock:
+            subs = list(self._subs.get(session_id, ()))
+        if not subs:
+            return
+        # 共享行情模式下先追上最新行情，算增量期间行情不动
+        with gs.synced():
+            for sub in subs:
+                msg = sub.cursor.delta(gs)
+                if msg is not None:
+                    sub.deliver(msg)
+
+    def resync(self, sub: Subscriber, gs: GameState) -> None:
+        sub.deliver(sub.cursor.snapshot(gs))
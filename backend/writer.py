@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Generic, TypeVar
+
+from loguru import logger
+
+# 单写线程：所有落盘都排进这里，由一个线程按批写 SQLite。
+# 同一个 session 在队列里只占一个位置——排队期间又改了几次，最后只写一次（写的时候才 dump 最新状态）。
+# 每个 session 的提交返回一个 Future，要求“写完才返回”的调用方（durability=sync）等它即可，
+# 同一批里的多个等待者共享一次事务提交。
+# write(batch) 返回 {session_id: 异常}：这几个 session 没写进去、也不该重试（比如版本冲突），
+# 对应的 Future 拿到异常；整批抛异常则放回队列稍后重试。
+
+E = TypeVar("E")
+
+
+class WriteQueue(Generic[E]):
+    def __init__(
+        self,
+        write: Callable[[list[tuple[str, E]]], dict[str, Exception]],
+        retry_delay: float = 1.0,
+    ) -> None:
+        self._write = write
+        self.retry_delay = retry_delay
+        self._pending: dict[str, E] = {}
+        self._futures: dict[str, Future] = {}
+        self._inflight: dict[str, E] = {}
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread: threading.Thread | None = None
+
+    def submit(self, session_id: str, entry: E) -> Future:
+        with self._cond:
+            self._pending[session_id] = entry
+            fut = self._futures.get(session_id)
+            if fut is None:
+                fut = self._futures[session_id] = Future()
+            self._cond.notify()
+        return fut
+
+    def peek(self, session_id: str) -> E | None:
+        """排队中 / 正在写的 entry：被淘汰但还没写完的 session 要从这里拿回来，不能去读旧的库。"""
+        with self._cond:
+            entry = self._pending.get(session_id)
+            if entry is None:
+                entry = self._inflight.get(session_id)
+            return entry
+
+    def discard(self, session_id: str) -> None:
+        """删档用：丢掉排队中的写，并等正在写它的那一批结束，免得删完又被写回来。"""
+        with self._cond:
+            self._pending.pop(session_id, None)
+            fut = self._futures.pop(session_id, None)
+            while session_id in self._inflight:
+                self._cond.wait()
+        if fut is not None and not fut.done():
+            fut.set_result(None)
+
+    def _take(self) -> tuple[list[tuple[str, E]], dict[str, Future]] | None:
+        with self._cond:
+            while not self._pending and not self._stopping:
+                self._cond.wait()
+            if not self._pending:
+                return None
+            batch, self._pending = self._pending, {}
+            futures, self._futures = self._futures, {}
+            self._inflight = batch
+            return list(batch.items()), futures
+
+    def _run(self) -> None:
+        while True:
+            taken = self._take()
+            if taken is None:
+                return
+            batch, futures = taken
+            try:
+                failed = self._write(batch)
+            except Exception as exc:
+                # 写失败：放回队列（期间又提交过的以新的为准），稍后重试；等待者直接拿到异常。
+                # 正在退出时不再重试，避免库坏了进程退不出去（日志里已经有异常）
+                with self._cond:
+                    if not self._stopping:
+                        for sid, entry in batch:
+                            self._pending.setdefault(sid, entry)
+                    self._inflight = {}
+                    self._cond.notify_all()
+                for fut in futures.values():
+                    fut.set_exception(exc)
+                if not self._stopping:
+                    logger.warning("write batch failed, retrying in {}s", self.retry_delay)
+                    time.sleep(self.retry_delay)
+                continue
+            with self._cond:
+                self._inflight = {}
+                self._cond.notify_all()
+            for sid, fut in futures.items():
+                exc = failed.get(sid)
+                if exc is None:
+                    fut.set_result(None)
+                else:
+                    fut.set_exception(exc)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="session-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        # 写完队列里剩下的再退出
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
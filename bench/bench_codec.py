@@ -0,0 +1,73 @@
+"""快照编码对比：json.dumps(to_dict) vs backend.codec（不压缩 / zlib）。
+
+用法（项目根目录）：
+    python -m bench.bench_codec --ticks 400 --repeat 50
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+from backend import codec
+from backend.engine.state import GameState
+
+
+def _session(ticks: int) -> GameState:
+    gs = GameState(frontend_dir=Path("frontend"))
+    codes = [p["code"] for p in gs.products]
+    for i in range(ticks):
+        sym = gs._main_contract(codes[i % len(codes)])
+        m = gs.market[sym]
+        side = "buy" if i % 2 == 0 else "sell"
+        gs.place_order({"symbol": sym, "side": side, "effect": "open", "price": m.last, "qty": 1})
+        gs.advance_tick()
+    return gs
+
+
+def _time(fn, repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat * 1000
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--ticks", type=int, default=400)
+    ap.add_argument("--repeat", type=int, default=50)
+    args = ap.parse_args()
+
+    d = _session(args.ticks).to_dict()
+
+    rows = []
+    raw = json.dumps(d, ensure_ascii=False).encode("utf-8")
+    rows.append(
+        (
+            "json",
+            len(raw),
+            _time(lambda: json.dumps(d, ensure_ascii=False).encode("utf-8"), args.repeat),
+            _time(lambda: json.loads(raw), args.repeat),
+        )
+    )
+    for level in (0, 1, 6):
+        blob = codec.encode(d, level=level)
+        assert codec.decode(blob) == d
+        rows.append(
+            (
+                f"codec zlib={level}",
+                len(blob),
+                _time(lambda: codec.encode(d, level=level), args.repeat),
+                _time(lambda: codec.decode(blob), args.repeat),
+            )
+        )
+
+    print(f"session: {args.ticks} ticks, {len(d['trades'])} trades, {len(d['orders'])} orders")
+    print(f"{'format':<14} {'bytes':>10} {'encode ms':>10} {'decode ms':>10}")
+    for name, size, enc, dec in rows:
+        print(f"{name:<14} {size:>10,} {enc:>10.2f} {dec:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
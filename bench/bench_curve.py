@@ -0,0 +1,67 @@
+"""全月份模拟的成本：只推进主力月（旧做法）vs 按货品成组推进全部月份，
+完整 advance_tick 在 ENDFIELD_CURVE=all / main 下的耗时，以及 /api/state 默认只给主力月 vs months=all 的响应体积。
+
+每项跑 --repeat 轮取最快的一轮，机器上别的负载造成的抖动不算进去。
+
+用法（项目根目录）：
+    python -m bench.bench_curve --ticks 2000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Callable
+
+from backend.engine.market import advance_curves, advance_market_tick
+from backend.engine.state import GameState
+
+
+def _best(step: Callable[[], None], ticks: int, repeat: int) -> float:
+    # 每 tick 的微秒数，取最快的一轮
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(ticks):
+            step()
+        best = min(best, time.perf_counter() - t0)
+    return best / ticks * 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--ticks", type=int, default=2000)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    gs = GameState(frontend_dir=Path("frontend"))
+    curves = [[gs.market[sym] for sym in curve] for curve in gs.catalog.curves()]
+    mains = [curve[0] for curve in curves]
+    print(f"{len(gs.products)} products x {len(gs.contract_months)} months")
+
+    def mains_only() -> None:
+        for m in mains:
+            advance_market_tick(m, gs.specs[m.code])
+
+    t_main = _best(mains_only, args.ticks, args.repeat)
+    print(f"mains only (old)        {t_main:6.1f} us/tick")
+    t_full = _best(lambda: advance_curves(curves, gs.specs), args.ticks, args.repeat)
+    print(f"full curve              {t_full:6.1f} us/tick   x{t_full / t_main:.2f}")
+
+    # 完整的 advance_tick（含撮合 / 风控 / 公告）；main 相当于 ENDFIELD_CURVE=main
+    for mode in ("all", "main"):
+        g = GameState(frontend_dir=Path("frontend"), seed=1)
+        g.curve_mode = mode
+        t = _best(g.advance_tick, args.ticks, args.repeat)
+        print(f"advance_tick curve={mode:<5}{t:6.1f} us/tick")
+        if mode == "all":
+            gs = g  # 响应体积按推进过的状态量（日K 会变长）
+
+    default = len(json.dumps(gs.state_payload(fields=["market", "day_klines"])))
+    full = len(json.dumps(gs.state_payload(fields=["market", "day_klines"], months=gs.contract_months)))
+    print(f"/api/state market+day_klines: main month {default:,} bytes, months=all {full:,} bytes")
+
+
+if __name__ == "__main__":
+    main()
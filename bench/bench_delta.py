@@ -0,0 +1,43 @@
+"""写放大对比：下一笔单之后，整包 state_json 和增量落盘各要写多少字节。
+
+用法（项目根目录）：
+    python -m bench.bench_delta
+"""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+from backend.engine.state import GameState
+
+
+def _size(obj: object) -> int:
+    return len(json.dumps(obj, ensure_ascii=False).encode("utf-8"))
+
+
+def _age(gs: GameState, orders: int) -> None:
+    # 挂远离现价的单然后撤掉，只为了让委托历史变长
+    sym = gs._main_contract(gs.products[0]["code"])
+    for _ in range(orders):
+        m = gs.market[sym]
+        gs.place_order({"symbol": sym, "side": "buy", "effect": "open", "price": m.limit_down, "qty": 1})
+        gs.cancel_all()
+        gs.advance_tick()
+
+
+def main() -> None:
+    print(f"{'orders in history':>18} {'full blob':>12} {'delta':>10}")
+    for n in (0, 100, 1000, 5000):
+        gs = GameState(frontend_dir=Path("frontend"))
+        _age(gs, n)
+        gs.mark_saved(gs.to_delta())  # 假装已经落过盘：之前的命令日志也算写过了
+
+        sym = gs._main_contract(gs.products[1]["code"])
+        gs.place_order({"symbol": sym, "side": "buy", "effect": "open", "price": gs.market[sym].last, "qty": 1})
+        full = _size(gs.to_dict())
+        delta = _size(gs.to_delta())
+        print(f"{n:>18} {full:>12,} {delta:>10,}")
+
+
+if __name__ == "__main__":
+    main()
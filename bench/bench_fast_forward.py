@@ -0,0 +1,69 @@
+"""快进对比：一天 20 次 POST /api/tick（每次推进 + 落盘增量）vs 一次 advance_ticks + 一次落盘。
+
+两边从同一个局面出发（行情只取决于 session 的种子和 tick 号），顺带检查结果一致（公告除外）。
+
+用法（项目根目录）：
+    python -m bench.bench_fast_forward --days 5
+"""
+from __future__ import annotations
+
+import argparse
+import copy
+import json
+import time
+from pathlib import Path
+
+from backend import codec
+from backend.engine.state import GameState
+
+
+def _comparable(gs: GameState) -> str:
+    # 公告、命令条数（n 条 advance_tick vs 1 条 advance_ticks）不同是预期的；成交 / 委托的 ts 是墙钟时间
+    d = gs.to_dict()
+    d.pop("round_log")
+    d.pop("journal_seq")
+    for row in d["trades"] + d["orders"]:
+        row.pop("ts")
+    return json.dumps(d, sort_keys=True)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--days", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    gs = GameState(frontend_dir=Path("frontend"), seed=args.seed)
+    for sym in list(gs.market)[:12]:
+        m = gs.market[sym]
+        gs.place_order({"symbol": sym, "side": "buy", "effect": "open", "price": m.last - 3 * gs.specs[m.code].tick, "qty": 2})
+        gs.place_order({"symbol": sym, "side": "buy", "effect": "open", "price": m.limit_down, "qty": 1})
+    gs.to_delta()
+    a, b = gs, copy.deepcopy(gs)
+    n = args.days * gs.ticks_per_day
+
+    t0 = time.perf_counter()
+    written = 0
+    for _ in range(n):
+        a.advance_tick()
+        delta = a.to_delta()
+        written += len(codec.encode(delta))
+        a.mark_saved(delta)
+    t_single = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    summary = b.advance_ticks(n)
+    written_bulk = len(codec.encode(b.to_delta()))
+    t_bulk = time.perf_counter() - t0
+
+    print(f"{n} ticks ({args.days} days), {summary['fills']} fills")
+    print(f"single ticks   {t_single * 1000:8.1f} ms   {written:>10,} bytes written in {n} saves")
+    print(f"advance_ticks  {t_bulk * 1000:8.1f} ms   {written_bulk:>10,} bytes written in 1 save")
+    same = _comparable(a) == _comparable(b)
+    print(f"same result    {same}")
+    if not same:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""命令日志落盘：每次改动都写快照（ENDFIELD_SNAPSHOT_EVERY=1 的做法）vs 只追加命令、每 N 条写一次快照。
+
+一个 session 挂着委托逐 tick 推进，每个 tick 落一次盘（和服务端时钟 + interval 落盘差不多），
+比较写库字节数 / 耗时，以及读档恢复（快照 + 重放尾巴）的耗时，并校验恢复出来的状态和内存里一致。
+数据库写到临时目录，不碰 data/。
+
+用法（项目根目录）：
+    python -m bench.bench_journal --ticks 450 --every 100
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from backend import codec, persist
+from backend.engine import state as state_mod
+from backend.engine.state import GameState
+
+
+def _comparable(gs: GameState) -> str:
+    return json.dumps(gs.to_dict(), sort_keys=True)
+
+
+def _run(label: str, every: int, ticks: int, seed: int) -> None:
+    state_mod.SNAPSHOT_EVERY = every
+    sid = f"bench-journal-{every}"
+    gs = GameState(frontend_dir=Path("frontend"), seed=seed)
+    for sym in list(gs.market)[:12]:
+        m = gs.market[sym]
+        gs.place_order({"symbol": sym, "side": "buy", "effect": "open", "price": m.last - 3 * gs.specs[m.code].tick, "qty": 2})
+    delta = gs.to_delta()
+    persist.save_many([(sid, delta)])
+    gs.mark_saved(delta)
+
+    written = snapshots = 0
+    t0 = time.perf_counter()
+    for _ in range(ticks):
+        gs.advance_tick()
+        delta = gs.to_delta()
+        written += len(codec.encode(delta))
+        snapshots += delta["snapshot"]
+        if persist.save_many([(sid, delta)]):
+            raise SystemExit("unexpected version conflict")
+        gs.mark_saved(delta)
+    t_write = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    d = persist.load_session(sid)
+    back = GameState.from_dict(d, frontend_dir=Path("frontend"))
+    t_load = time.perf_counter() - t0
+    same = _comparable(back) == _comparable(gs)
+    print(
+        f"{label:<22} {t_write / ticks * 1e3:7.2f} ms/save  {written / ticks:9,.0f} bytes/save  "
+        f"{snapshots:4d} snapshots   load {t_load * 1e3:6.1f} ms (replay {len(d['journal_tail'])})   same {same}"
+    )
+    if not same:
+        raise SystemExit(1)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--ticks", type=int, default=450)
+    ap.add_argument("--every", type=int, default=100, help="每多少条命令写一次快照")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    os.environ["ENDFIELD_DB_PATH"] = str(Path(tempfile.mkdtemp(prefix="endfield-bench-")) / "bench.sqlite3")
+    persist.init_db()
+    print(f"{args.ticks} ticks, one save per tick")
+    _run("snapshot every save", 1, args.ticks, args.seed)
+    _run(f"journal, snapshot/{args.every}", args.every, args.ticks, args.seed)
+    persist.close_db()
+
+
+if __name__ == "__main__":
+    main()
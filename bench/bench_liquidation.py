@@ -0,0 +1,84 @@
+"""强平对比：旧的逐手循环 vs _plan_liquidation 一次算好再按仓位平仓。
+
+同一个爆仓账户各跑一遍，只比较耗时；两种做法结果一致由 tests/test_liquidation.py 保证。
+
+用法（项目根目录）：
+    python -m bench.bench_liquidation --positions 200 --lots 500 --cases 20
+"""
+from __future__ import annotations
+
+import argparse
+import copy
+import random
+import time
+from pathlib import Path
+
+from backend.engine.market import init_market
+from backend.engine.models import Position
+from backend.engine.state import GameState
+from tests.test_liquidation import liquidate_planned, liquidate_stepwise
+
+
+def _blown_account(rng: random.Random, positions: int, lots: int) -> GameState:
+    gs = GameState(frontend_dir=Path("frontend"))
+    codes = [p["code"] for p in gs.products]
+    symbols = list(gs.market)
+    while len(symbols) < positions:
+        code = codes[len(symbols) % len(codes)]
+        sym = f"{code}X{len(symbols):04d}"
+        gs.market[sym] = init_market(symbol=sym, code=code, spec=gs.specs[code])
+        symbols.append(sym)
+
+    # 把总手数随机分到各个仓位上，开仓价围绕现价上下浮动
+    split = [1] * positions
+    for _ in range(max(0, lots - positions)):
+        split[rng.randrange(positions)] += 1
+    for sym, qty in zip(rng.sample(symbols, positions), split):
+        m = gs.market[sym]
+        spec = gs.specs[m.code]
+        side = rng.choice(["long", "short"])
+        gs.positions[(sym, side)] = Position(
+            symbol=sym,
+            side=side,
+            qty=qty,
+            avg_open=m.last + rng.randint(-20, 20) * spec.tick,
+            mult=spec.mult,
+            margin=0.0,
+        )
+    gs._rebuild_exposure()
+
+    # 现金压到维持率 0.6–0.95 之间
+    acc = gs._account_payload_base()
+    gs.cash = acc["margin_used"] * rng.uniform(0.6, 0.95) - acc["unrealized_pnl"]
+    return gs
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--positions", type=int, default=200)
+    ap.add_argument("--lots", type=int, default=500)
+    ap.add_argument("--cases", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    t_step = t_plan = 0.0
+    for _ in range(args.cases):
+        gs = _blown_account(rng, args.positions, args.lots)
+        a, b = gs, copy.deepcopy(gs)
+
+        t0 = time.perf_counter()
+        liquidate_stepwise(a, a.call_ratio)
+        t_step += time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        liquidate_planned(b, b.call_ratio)
+        t_plan += time.perf_counter() - t0
+
+    print(f"{args.cases} accounts, {args.positions} positions / {args.lots} lots each")
+    print(f"stepwise loop   {t_step / args.cases * 1000:8.2f} ms per liquidation")
+    print(f"planned         {t_plan / args.cases * 1000:8.2f} ms per liquidation")
+
+
+if __name__ == "__main__":
+    main()
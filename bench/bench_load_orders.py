@@ -0,0 +1,91 @@
+"""下单接口压测：几百个 session 同时 POST /api/orders，看延迟分布（p50 / p99）。
+
+进程内用 httpx.ASGITransport 直连 app（不经过网络），每个 session 一个客户端、各带各的 cookie。
+先 bootstrap 全部 session，再让它们并发下单；数据库写到临时目录，不碰 data/。
+
+用法（项目根目录，需要 httpx）：
+    python -m bench.bench_load_orders --sessions 300 --orders 20
+    python -m bench.bench_load_orders --sessions 300 --orders 20 --durability sync
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+
+def _pct(samples: list[float], q: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+async def _run(args: argparse.Namespace) -> None:
+    import httpx
+
+    from backend.app import app
+
+    rng = random.Random(args.seed)
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        clients = [httpx.AsyncClient(transport=transport, base_url="http://bench") for _ in range(args.sessions)]
+        symbols = []
+        for c in clients:
+            await c.get("/api/bootstrap")
+            market = (await c.get("/api/state", params={"fields": "market"})).json()["market"]
+            symbols.append(list(market))
+
+        latencies: list[float] = []
+        gate = asyncio.Semaphore(args.concurrency)
+
+        async def _one(c: httpx.AsyncClient, syms: list[str]) -> None:
+            for _ in range(args.orders):
+                sym = rng.choice(syms)
+                # 远离现价的限价单：只挂单不成交，测的是接口本身 + 落盘
+                body = {"symbol": sym, "side": rng.choice(["buy", "sell"]), "effect": "open", "price": 1.0, "qty": 1}
+                async with gate:
+                    t0 = time.perf_counter()
+                    r = await c.post("/api/orders", json=body)
+                    latencies.append(time.perf_counter() - t0)
+                r.raise_for_status()
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(_one(c, syms) for c, syms in zip(clients, symbols)))
+        wall = time.perf_counter() - t0
+        for c in clients:
+            await c.aclose()
+
+    latencies.sort()
+    ms = [x * 1000 for x in latencies]
+    print(f"{args.sessions} sessions x {args.orders} orders, concurrency {args.concurrency}, durability {args.durability}")
+    print(f"throughput  {len(ms) / wall:10.1f} req/s")
+    print(f"mean        {statistics.fmean(ms):10.2f} ms")
+    for name, q in (("p50", 0.50), ("p90", 0.90), ("p99", 0.99)):
+        print(f"{name:<11} {_pct(ms, q):10.2f} ms")
+    print(f"max         {ms[-1]:10.2f} ms")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", type=int, default=300)
+    ap.add_argument("--orders", type=int, default=20)
+    ap.add_argument("--concurrency", type=int, default=256, help="同时在途的请求数上限")
+    ap.add_argument("--durability", default="interval", choices=["sync", "interval", "evict"])
+    ap.add_argument("--cache-size", type=int, default=512, help="小于 --sessions 时会不停淘汰 / 重新加载")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    # app 在导入时读环境变量，要在 import 之前设好
+    tmp = tempfile.mkdtemp(prefix="endfield-bench-")
+    os.environ["ENDFIELD_DB_PATH"] = str(Path(tmp) / "bench.sqlite3")
+    os.environ["ENDFIELD_DURABILITY"] = args.durability
+    os.environ["ENDFIELD_CACHE_SIZE"] = str(args.cache_size)
+    os.environ.setdefault("ENDFIELD_TICK_INTERVAL", "0")
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""SQLite 持久层微基准：每次调用新开连接 vs 线程长连接，以及 save_many 批量提交增量。
+
+前两组读的是同一批 sessions 行（开局存档的账户小字段，几百字节）：
+旧写法每次 connect + 两条 pragma + 查询，新写法复用线程长连接只查询；计时里不含推进 / 编解码，差的就是连接开销。
+最后一组模拟有 session 缓存之后的真实写法：读只发生在缓存 miss，每个请求只写一个 tick 的增量。
+
+用法（项目根目录）：
+    python -m bench.bench_persist --sessions 200 --rounds 5
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+_SQL_LOAD_LEGACY = "SELECT state_json FROM sessions WHERE session_id = ?"
+
+
+def _legacy_load(path: Path, sid: str) -> sqlite3.Row | None:
+    # 旧实现：每次调用都 open + 两条 pragma，查完关掉
+    conn = sqlite3.connect(str(path), check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        return conn.execute(_SQL_LOAD_LEGACY, (sid,)).fetchone()
+    finally:
+        conn.close()
+
+
+def _rate(label: str, ops: int, seconds: float) -> None:
+    print(f"{label:<28} {ops / seconds:>10.0f} req/s  ({ops} ops, {seconds:.3f}s)")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", type=int, default=200)
+    ap.add_argument("--rounds", type=int, default=5)
+    args = ap.parse_args()
+
+    tmp = Path(tempfile.mkdtemp()) / "bench.sqlite3"
+    os.environ["ENDFIELD_DB_PATH"] = str(tmp)
+
+    from backend import persist
+    from backend.engine.state import GameState
+
+    persist.init_db()
+    gs = GameState(frontend_dir=Path("frontend"), seed=1)
+    sids = [f"bench-session-{i:05d}" for i in range(args.sessions)]
+    ops = args.sessions * args.rounds
+
+    # 同一个开局存档写成所有 session，两组读的是一模一样的行
+    full = gs.to_delta()
+    assert not persist.save_many((sid, full) for sid in sids)
+    gs.mark_saved(full)
+    conn = persist._connect()
+    size = conn.execute("SELECT length(state_json) FROM sessions WHERE session_id = ?", (sids[0],)).fetchone()[0]
+    print(f"state_json row: {size:,} bytes")
+
+    t0 = time.perf_counter()
+    for _ in range(args.rounds):
+        for sid in sids:
+            _legacy_load(tmp, sid)
+    _rate("per-call connect + query", ops, time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    for _ in range(args.rounds):
+        for sid in sids:
+            persist._connect().execute(persist._SQL_LOAD, (sid,)).fetchone()
+    _rate("pooled connection query", ops, time.perf_counter() - t0)
+
+    # 有 session 缓存之后：不再每次读库，只写增量，一批 session 一个事务
+    # 同一个 GameState 冒充所有 session：版本号按 session 单独记，否则 compare-and-swap 会把写跳过
+    versions = dict(conn.execute("SELECT session_id, version FROM sessions").fetchall())
+    t0 = time.perf_counter()
+    for _ in range(args.rounds):
+        batch = []
+        for sid in sids:
+            gs.advance_tick()
+            delta = gs.to_delta()
+            # 每个增量只带自己这个 tick 的命令，和真实落盘一样写完就从内存里去掉
+            gs.mark_saved(delta)
+            batch.append((sid, {**delta, "version": versions[sid]}))
+            versions[sid] += 1
+        skipped = persist.save_many(batch)
+        assert not skipped, skipped
+    _rate("save_many (tick deltas)", ops, time.perf_counter() - t0)
+
+    persist.close_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""持仓存储对比：旧的列表线性查找 + 整表重建 vs (symbol, side) 字典索引。
+
+用法（项目根目录）：
+    python -m bench.bench_positions --symbols 300
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from pathlib import Path
+
+from backend.engine.market import init_market
+from backend.engine.models import Position
+from backend.engine.state import GameState
+
+
+class _ListPositions:
+    # 旧实现：线性扫描查找，平到 0 时整表重建
+    def __init__(self, positions: list[Position]) -> None:
+        self.positions = list(positions)
+
+    def get(self, symbol: str, side: str) -> Position | None:
+        for p in self.positions:
+            if p.symbol == symbol and p.side == side:
+                return p
+        return None
+
+    def close_one(self, symbol: str, side: str) -> None:
+        pos = self.get(symbol, side)
+        if pos is None:
+            return
+        pos.qty -= 1
+        if pos.qty == 0:
+            self.positions = [p for p in self.positions if not (p.symbol == symbol and p.side == side)]
+
+
+def _state(symbols: int) -> GameState:
+    gs = GameState(frontend_dir=Path("frontend"))
+    codes = [p["code"] for p in gs.products]
+    for i in range(symbols):
+        code = codes[i % len(codes)]
+        sym = f"{code}X{i:04d}"
+        gs.market[sym] = init_market(symbol=sym, code=code, spec=gs.specs[code])
+    for sym, m in gs.market.items():
+        spec = gs.specs[m.code]
+        for side in ("long", "short"):
+            gs.positions[(sym, side)] = Position(
+                symbol=sym, side=side, qty=3, avg_open=m.last, mult=spec.mult, margin=0.0
+            )
+    return gs
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--symbols", type=int, default=300)
+    ap.add_argument("--lookups", type=int, default=20_000)
+    args = ap.parse_args()
+
+    gs = _state(args.symbols)
+    keys = list(gs.positions)
+    probe = [random.choice(keys) for _ in range(args.lookups)]
+    legacy = _ListPositions([Position(**vars(p)) for p in gs.positions.values()])
+    print(f"{len(keys)} positions over {len(gs.market)} symbols")
+
+    t0 = time.perf_counter()
+    for sym, side in probe:
+        legacy.get(sym, side)
+    t_list = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for sym, side in probe:
+        gs._get_pos(sym, side)
+    t_dict = time.perf_counter() - t0
+    print(f"lookup x{args.lookups}:       list {t_list * 1000:8.1f} ms   dict {t_dict * 1000:8.1f} ms")
+
+    # 把所有持仓一手一手平光（强平就是这种调用模式）
+    order = [k for k in keys for _ in range(3)]
+    random.shuffle(order)
+    t0 = time.perf_counter()
+    for sym, side in order:
+        legacy.close_one(sym, side)
+    t_list = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for sym, side in order:
+        gs._close_pos(sym, side, 1, log_title="bench")
+    t_dict = time.perf_counter() - t0
+    print(f"close {len(order)} lots one by one: list {t_list * 1000:8.1f} ms   GameState {t_dict * 1000:8.1f} ms")
+    print("(GameState._close_pos 还包含结算、成交记录和日志，不只是持仓增删)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""分片扩展性：同样一批 session，单进程推进 vs 分给 N 个 worker 进程并行推进，看每秒能推进多少 session-tick。
+
+每一轮相当于服务端时钟的一拍：各 worker 把自己名下的活跃 session 各推进一个 tick。
+CPU 核数不够时多开 worker 没有意义，输出里会带上本机核数。数据库写到临时目录，不碰 data/。
+
+用法（项目根目录）：
+    python -m bench.bench_shards --sessions 400 --rounds 20 --shards 1,2,4
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+
+def _sid(i: int) -> str:
+    return f"bench-session-{i:08d}"
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", type=int, default=400)
+    ap.add_argument("--rounds", type=int, default=20)
+    ap.add_argument("--shards", default="1,2,4", help="逗号分隔的 worker 数")
+    args = ap.parse_args()
+
+    # worker 是 spawn 出来的，会继承这里的环境变量；要在导入 app 之前设好
+    tmp = tempfile.mkdtemp(prefix="endfield-bench-")
+    os.environ["ENDFIELD_DB_PATH"] = str(Path(tmp) / "bench.sqlite3")
+    os.environ["ENDFIELD_CACHE_SIZE"] = str(args.sessions * 2)
+    os.environ["ENDFIELD_TICK_INTERVAL"] = "0"
+    # 多个进程写同一个库只能用 sync 落盘（见 persist.claim_db）
+    os.environ["ENDFIELD_DURABILITY"] = "sync"
+    os.environ.pop("ENDFIELD_SHARDS", None)
+
+    from backend import app as api
+    from backend.shard import ShardPool
+
+    print(f"{args.sessions} sessions x {args.rounds} rounds, {os.cpu_count()} CPU(s)")
+
+    api.shard_worker_start()
+    for i in range(args.sessions):
+        api._bootstrap_payload(_sid(i), None)
+    # 和分片那边一样先空跑一轮：新开的局第一次落盘是整体重写，不算在里面
+    api._tick_active()
+    t0 = time.perf_counter()
+    for _ in range(args.rounds):
+        api._tick_active()
+    base = args.sessions * args.rounds / (time.perf_counter() - t0)
+    api.shard_worker_stop()
+    print(f"in-process  {base:10.0f} session-ticks/s")
+
+    for n in (int(x) for x in args.shards.split(",") if x):
+        pool = ShardPool(n, "backend.app")
+        pool.start()
+        try:
+            futs = [pool.submit(pool.shard_of(_sid(i)), "_bootstrap_payload", _sid(i), None) for i in range(args.sessions)]
+            for f in futs:
+                f.result()
+            counts = pool.broadcast("_tick_active")
+            t0 = time.perf_counter()
+            for _ in range(args.rounds):
+                pool.broadcast("_tick_active")
+            rate = args.sessions * args.rounds / (time.perf_counter() - t0)
+        finally:
+            pool.stop()
+        print(f"{n} shard(s)  {rate:10.0f} session-ticks/s   x{rate / base:4.2f}   sessions per shard {counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""多人行情对比：每个 session 各自模拟一份行情 vs 全服共享一份行情（SharedMarket）。
+
+同样 N 个 session，各挂几张不会成交的委托、开一手持仓，推进若干 tick，比较耗时和每个 session 落盘的体积。
+
+用法（项目根目录）：
+    python -m bench.bench_shared --sessions 500 --ticks 20
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from pathlib import Path
+
+from backend import codec
+from backend.engine.shared import SharedMarket
+from backend.engine.state import GameState
+
+
+def _seed(gs: GameState, rng: random.Random) -> None:
+    syms = [gs._main_contract(p["code"]) for p in gs.products]
+    for sym in rng.sample(syms, 3):
+        m = gs.market[sym]
+        spec = gs.specs[m.code]
+        gs.place_order({"symbol": sym, "side": "buy", "effect": "open", "price": m.last, "qty": 1})
+        gs.place_order({"symbol": sym, "side": "buy", "effect": "open", "price": m.limit_down, "qty": 1})
+        gs.place_order({"symbol": sym, "side": "sell", "effect": "open", "price": m.limit_up - spec.tick, "qty": 1})
+
+
+def _delta_bytes(states: list[GameState]) -> int:
+    return sum(len(codec.encode(gs.to_delta())) for gs in states)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", type=int, default=500)
+    ap.add_argument("--ticks", type=int, default=20)
+    args = ap.parse_args()
+    frontend = Path("frontend")
+
+    rng = random.Random(1)
+    private = [GameState(frontend_dir=frontend) for _ in range(args.sessions)]
+    for gs in private:
+        _seed(gs, rng)
+    full_private = _delta_bytes(private)
+    t0 = time.perf_counter()
+    for _ in range(args.ticks):
+        for gs in private:
+            gs.advance_tick()
+    t_private = time.perf_counter() - t0
+    tick_private = _delta_bytes(private)
+
+    rng = random.Random(1)
+    market = SharedMarket()
+    shared = [GameState(frontend_dir=frontend, shared=market) for _ in range(args.sessions)]
+    for gs in shared:
+        _seed(gs, rng)
+    full_shared = _delta_bytes(shared)
+    t0 = time.perf_counter()
+    for _ in range(args.ticks):
+        market.advance()
+        for gs in shared:
+            gs.advance_tick()
+    t_shared = time.perf_counter() - t0
+    tick_shared = _delta_bytes(shared)
+
+    n = args.sessions * args.ticks
+    print(f"{args.sessions} sessions x {args.ticks} ticks")
+    print(f"private market   {t_private / n * 1e6:8.1f} us per session-tick   "
+          f"full save {full_private / args.sessions / 1024:7.1f} KiB   after ticks {tick_private / args.sessions / 1024:7.1f} KiB")
+    print(f"shared market    {t_shared / n * 1e6:8.1f} us per session-tick   "
+          f"full save {full_shared / args.sessions / 1024:7.1f} KiB   after ticks {tick_shared / args.sessions / 1024:7.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
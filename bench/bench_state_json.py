@@ -0,0 +1,83 @@
+"""/api/state 编码对比：FastAPI 默认（按返回类型校验 + 序列化 dict）vs fastjson（orjson + 预编码行情片段）。
+
+造一个有 1,000 笔成交的 session，挂在两个只差响应编码方式的路由上，用 TestClient 测请求延迟。
+
+用法（项目根目录，需要 fastapi / httpx；装了 orjson 才有预编码片段）：
+    python -m bench.bench_state_json --trades 1000 --requests 200
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import time
+from pathlib import Path
+
+from fastapi import FastAPI, Response
+from fastapi.testclient import TestClient
+
+from backend import fastjson
+from backend.engine.state import GameState
+
+
+def _session(trades: int) -> GameState:
+    rng = random.Random(1)
+    gs = GameState(frontend_dir=Path("frontend"))
+    syms = [gs._main_contract(p["code"]) for p in gs.products]
+    while len(gs.trades) < trades:
+        sym = rng.choice(syms)
+        m = gs.market[sym]
+        side = rng.choice(["buy", "sell"])
+        # 按现价下单，立刻成交；开平交替，保证金不会被占满
+        effect = "close" if gs._get_pos(sym, "long" if side == "sell" else "short") else "open"
+        gs.place_order({"symbol": sym, "side": side, "effect": effect, "price": m.last, "qty": 1})
+        if rng.random() < 0.1:
+            gs.advance_tick()
+    return gs
+
+
+def _app(gs: GameState) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/old")
+    def old() -> dict:
+        return gs.state_payload()
+
+    @app.get("/new")
+    def new() -> Response:
+        frag = fastjson.fragment if fastjson.available() else None
+        return Response(content=fastjson.dumps(gs.state_payload(fragment=frag)), media_type="application/json")
+
+    return app
+
+
+def _time(client: TestClient, path: str, n: int) -> tuple[float, int]:
+    client.get(path)
+    samples = []
+    size = 0
+    for _ in range(n):
+        t0 = time.perf_counter()
+        r = client.get(path)
+        samples.append(time.perf_counter() - t0)
+        size = len(r.content)
+    return statistics.median(samples), size
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--trades", type=int, default=1000)
+    ap.add_argument("--requests", type=int, default=200)
+    args = ap.parse_args()
+
+    gs = _session(args.trades)
+    client = TestClient(_app(gs))
+    assert client.get("/old").json() == client.get("/new").json()
+
+    print(f"{len(gs.trades)} trades, {len(gs.orders)} orders, orjson: {fastjson.available()}")
+    for path, label in (("/old", "FastAPI default"), ("/new", "fastjson + fragments")):
+        med, size = _time(client, path, args.requests)
+        print(f"{label:26} {med * 1000:8.2f} ms median   {size / 1024:7.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
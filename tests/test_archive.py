@@ -0,0 +1,78 @@
+"""归档回归：压在 orders_floor 以下的未成交委托，被挪进归档之后才成交，归档和历史里都要是成交后的状态、且只出现一次。
+
+pytest 或者直接跑（项目根目录）：
+    python -m tests.test_archive
+"""
+from __future__ import annotations
+
+import os
+import tempfile
+from pathlib import Path
+
+from backend import codec, persist
+from backend.engine import state as state_mod
+from backend.engine.state import GameState
+
+FRONTEND_DIR = Path(__file__).resolve().parents[1] / "frontend"
+SID = "archive-regression-0001"
+
+
+def _save(gs: GameState) -> None:
+    delta = gs.to_delta()
+    assert not persist.save_many([(SID, delta)])
+    gs.mark_saved(delta)
+
+
+def _round_trips(gs: GameState, sym: str, n: int) -> None:
+    # 开一手马上平掉：每轮两笔立即成交的委托，把已结束委托推过内存窗口
+    m = gs.market[sym]
+    for _ in range(n):
+        assert gs.place_order({"symbol": sym, "side": "buy", "effect": "open", "price": m.limit_up, "qty": 1})["ok"]
+        assert gs.place_order({"symbol": sym, "side": "sell", "effect": "close", "price": m.limit_down, "qty": 1})["ok"]
+        _save(gs)
+
+
+def test_order_below_floor_fills_after_archive() -> None:
+    saved = os.environ.get("ENDFIELD_DB_PATH"), state_mod.ORDERS_HOT, state_mod.SNAPSHOT_EVERY
+    os.environ["ENDFIELD_DB_PATH"] = str(Path(tempfile.mkdtemp(prefix="endfield-test-")) / "t.sqlite3")
+    # 窗口调小、每次都写快照：几笔委托就能触发归档，委托行每次都落盘
+    state_mod.ORDERS_HOT, state_mod.SNAPSHOT_EVERY = 2, 1
+    persist.close_db()
+    try:
+        persist.init_db()
+        gs = GameState(frontend_dir=FRONTEND_DIR, seed=1)
+        sym = next(iter(gs.market))
+        m = gs.market[sym]
+        resting = gs.place_order({"symbol": sym, "side": "buy", "effect": "open", "price": m.limit_down, "qty": 1})
+        _save(gs)
+        _round_trips(gs, sym, 6)
+        assert gs._orders_floor > resting["order_id"]
+
+        # 价格打到挂单价，压在下限以下的那笔成交
+        m.last = m.limit_down
+        gs._after_market_tick([sym])
+        _save(gs)
+        # 再推几轮，让归档再跑几次
+        _round_trips(gs, sym, 6)
+
+        conn = persist._connect()
+        rows = conn.execute(
+            "SELECT data FROM archive_orders WHERE session_id = ? AND order_id = ?", (SID, resting["order_id"])
+        ).fetchall()
+        assert [codec.decode(r["data"])["status"] for r in rows] == ["filled"]
+        history = persist.load_order_history(SID, gs._orders_floor, 1000)
+        ids = [o["order_id"] for o in history]
+        assert len(ids) == len(set(ids))
+        assert [o["status"] for o in history if o["order_id"] == resting["order_id"]] == ["filled"]
+    finally:
+        persist.close_db()
+        path, state_mod.ORDERS_HOT, state_mod.SNAPSHOT_EVERY = saved
+        if path is None:
+            os.environ.pop("ENDFIELD_DB_PATH", None)
+        else:
+            os.environ["ENDFIELD_DB_PATH"] = path
+
+
+if __name__ == "__main__":
+    test_order_below_floor_fills_after_archive()
+    print("ok")
@@ -0,0 +1,53 @@
+"""存档编码回归：用户数据里带 "__a__" 键照样原样读回；v1 存档（数组区打包）和旧 JSON 文本还能读。
+
+pytest 或者直接跑（项目根目录）：
+    python -m tests.test_codec
+"""
+from __future__ import annotations
+
+import json
+import struct
+from array import array
+
+from backend import codec
+
+# 以前从 POST /api/orders 原样记进日志的 payload
+COLLIDING = {"op": "place_order", "args": [{"__a__": ["d", 0, 0, 3]}], "ts": "00:00:01"}
+
+
+def _v1_blob(doc: dict, arrays: bytes) -> bytes:
+    text = json.dumps(doc).encode("utf-8")
+    return b"EF" + bytes([1, 0]) + struct.pack("<I", len(text)) + text + arrays
+
+
+def test_user_array_key_round_trips() -> None:
+    for level in (0, 1):
+        payload = {**COLLIDING, "pad": "x" * 300}
+        assert codec.decode(codec.encode(payload, level=level)) == payload
+
+
+def test_v1_blobs_still_decode() -> None:
+    series = [100.0, 101.0, 99.0, 99.0]
+    deltas = array("b", [1, -2, 0]).tobytes()
+    doc = {"series": {"__a__": ["b", 100, 0, 4]}, "args": [{"__a__": ["d", 0, 0, 3]}], "bad": {"__a__": "x"}}
+    # 数组区只有 3 字节：第二个占位按 float64 要 24 字节，越界，就当普通 dict 留着
+    back = codec.decode(_v1_blob(doc, deltas))
+    assert back == {"series": series, "args": [{"__a__": ["d", 0, 0, 3]}], "bad": {"__a__": "x"}}
+
+    assert codec.decode(json.dumps(COLLIDING)) == COLLIDING
+    assert codec.decode(json.dumps(COLLIDING).encode("utf-8")) == COLLIDING
+
+
+def test_unknown_version_is_rejected() -> None:
+    try:
+        codec.decode(b"EF" + bytes([9, 0]) + b"{}")
+    except ValueError:
+        return
+    raise AssertionError("expected ValueError")
+
+
+if __name__ == "__main__":
+    test_user_array_key_round_trips()
+    test_v1_blobs_still_decode()
+    test_unknown_version_is_rejected()
+    print("ok")
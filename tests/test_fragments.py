@@ -0,0 +1,45 @@
+"""预编码片段回归：ENDFIELD_CURVE=main 时远月不推进、分时不追加，换日重算的昨结 / 涨跌停也要反映到 /api/state 里。
+
+pytest 或者直接跑（项目根目录）：
+    python -m tests.test_fragments
+"""
+from __future__ import annotations
+
+from pathlib import Path
+
+from backend.engine.state import GameState
+
+FRONTEND_DIR = Path(__file__).resolve().parents[1] / "frontend"
+FIELDS = ("prev_settle", "limit_up", "limit_down", "open", "high", "low", "last", "vol")
+
+
+def _keep(obj: object) -> object:
+    # 代替 fastjson.fragment：不依赖 orjson，缓存里存的就是当时算出来的 dict
+    return obj
+
+
+def test_far_month_fragment_refreshes_on_day_roll() -> None:
+    gs = GameState(frontend_dir=FRONTEND_DIR, seed=5)
+    far = gs.contract_months[-1]
+    sym = next(s for s in gs.market if s.endswith(far))
+
+    def served() -> dict:
+        return gs.state_payload(fields=["market"], months=[far], fragment=_keep)["market"][sym]
+
+    # 全部月份推进到半天（远月离开昨结），片段缓存起来，然后改成只推主力月（比如换了配置重启）
+    gs.advance_ticks(gs.ticks_per_day // 2)
+    before = served()
+    gs.curve_mode = "main"
+    appended = gs.market[sym].series.appended
+    # 推过换日：远月的分时一个点都没加，昨结 / 涨跌停 / 开高低 / 成交量却按收盘重算了
+    gs.advance_ticks(gs.ticks_per_day)
+    assert gs.market[sym].series.appended == appended
+    assert gs.market[sym].prev_settle != before["prev_settle"]
+
+    m = gs.market[sym]
+    assert {k: served()[k] for k in FIELDS} == {k: getattr(m, k) for k in FIELDS}
+
+
+if __name__ == "__main__":
+    test_far_month_fragment_refreshes_on_day_roll()
+    print("ok")
@@ -0,0 +1,89 @@
+"""命令日志回归：日志里只记整理过的参数，被拒绝 / 没改动的命令不记；坏掉的命令重放时跳过，session 照样读得出来。
+
+pytest 或者直接跑（项目根目录）：
+    python -m tests.test_journal
+"""
+from __future__ import annotations
+
+import os
+import tempfile
+from pathlib import Path
+
+from backend import persist
+from backend.engine.state import GameState
+
+FRONTEND_DIR = Path(__file__).resolve().parents[1] / "frontend"
+SID = "journal-regression-0001"
+
+
+def _use_temp_db() -> str | None:
+    saved = os.environ.get("ENDFIELD_DB_PATH")
+    os.environ["ENDFIELD_DB_PATH"] = str(Path(tempfile.mkdtemp(prefix="endfield-test-")) / "t.sqlite3")
+    persist.close_db()
+    persist.init_db()
+    return saved
+
+
+def _restore_db(saved: str | None) -> None:
+    persist.close_db()
+    if saved is None:
+        os.environ.pop("ENDFIELD_DB_PATH", None)
+    else:
+        os.environ["ENDFIELD_DB_PATH"] = saved
+
+
+def test_journal_keeps_normalized_accepted_commands_only() -> None:
+    gs = GameState(frontend_dir=FRONTEND_DIR, seed=1)
+    sym = next(iter(gs.market))
+    m = gs.market[sym]
+
+    # 被拒绝的都不记，客户端塞进来的东西也就进不了日志
+    assert not gs.place_order({"__a__": ["d", 0, 0, 3]})["ok"]
+    assert not gs.place_order({"symbol": sym, "side": "buy", "effect": "open", "price": "abc", "qty": 1})["ok"]
+    assert not gs.place_order({"symbol": sym, "side": "hold", "effect": "open", "price": m.last, "qty": 1})["ok"]
+    # 没有这个仓位：平仓什么都没改
+    gs.close_position({"symbol": sym, "side": "long", "qty": 1})
+    assert gs._journal == []
+
+    px = m.limit_down
+    assert gs.place_order({"symbol": f" {sym} ", "side": "buy", "effect": "open", "price": str(px), "qty": "2", "note": {"x": 1}})["ok"]
+    assert [cmd for _, cmd in gs._journal] == [
+        {
+            "op": "place_order",
+            "args": [{"symbol": sym, "side": "buy", "effect": "open", "price": px, "qty": 2}],
+            "ts": gs._journal[0][1]["ts"],
+        }
+    ]
+
+
+def test_replay_skips_unreplayable_commands() -> None:
+    saved = _use_temp_db()
+    try:
+        gs = GameState(frontend_dir=FRONTEND_DIR, seed=2)
+        delta = gs.to_delta()
+        assert not persist.save_many([(SID, delta)])
+        gs.mark_saved(delta)
+
+        # 旧版本记下的原样 payload（被 codec 解成了 list）、未知操作、缺字段的命令，后面跟一条正常的
+        bad = [
+            (1, {"op": "place_order", "args": [["d", 0, 0, 3]], "ts": "00:00:01"}),
+            (2, {"op": "drop_tables", "args": [], "ts": "00:00:02"}),
+            (3, {"op": "advance_ticks"}),
+            (4, {"op": "advance_tick", "args": [], "ts": "00:00:04"}),
+        ]
+        assert not persist.save_many([(SID, {"snapshot": False, "version": gs._db_version, "journal": bad})])
+
+        back = GameState.from_dict(persist.load_session(SID), frontend_dir=FRONTEND_DIR)
+        assert back.tick == gs.tick + 1
+        assert back._journal_seq == 4
+        # 之后新记的命令接着往后编号，不会和库里的撞号
+        back.advance_tick()
+        assert back._journal[-1][0] == 5
+    finally:
+        _restore_db(saved)
+
+
+if __name__ == "__main__":
+    test_journal_keeps_normalized_accepted_commands_only()
+    test_replay_skips_unreplayable_commands()
+    print("ok")
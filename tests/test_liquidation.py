@@ -0,0 +1,119 @@
+"""强平回归：_plan_liquidation 一次算好的计划，和旧的逐手循环（每次挑占用保证金最大的仓位平 1 手）结果一致。
+
+固定种子的几种账户：只平掉一部分仓位、行情封在涨跌停上、多仓位且占用保证金打平。
+pytest 或者直接跑（项目根目录）：
+    python -m tests.test_liquidation
+"""
+from __future__ import annotations
+
+import copy
+import math
+import random
+from pathlib import Path
+
+from backend.engine.models import Position
+from backend.engine.state import GameState
+
+FRONTEND_DIR = Path(__file__).resolve().parents[1] / "frontend"
+
+
+def liquidate_stepwise(gs: GameState, target: float) -> None:
+    """旧实现：每次重算账户、扫描全部持仓，挑占用保证金最大的平 1 手（bench_liquidation 也拿它计时）。"""
+    max_steps = sum(p.qty for p in gs.positions.values()) + 10
+    steps = 0
+    while steps < max_steps and gs.positions:
+        acc = gs._account_payload_base()
+        if gs._compute_margin_ratio(acc["equity"], acc["margin_used"]) >= target:
+            break
+        best = None
+        best_mu = -1.0
+        for p in gs.positions.values():
+            m = gs.market[p.symbol]
+            spec = gs.specs[m.code]
+            mu = m.last * spec.mult * p.qty * spec.margin
+            if mu > best_mu:
+                best_mu = mu
+                best = p
+        if best is None:
+            break
+        gs._close_pos(best.symbol, best.side, 1, log_title="强平平仓")
+        steps += 1
+
+
+def liquidate_planned(gs: GameState, target: float) -> None:
+    for (symbol, side), lots in gs._plan_liquidation(target).items():
+        gs._close_pos(symbol, side, lots, log_title="强平平仓")
+
+
+def _account(gs: GameState, holdings: list[tuple[str, str, int, int]], ratio: float) -> GameState:
+    # holdings: (合约, 方向, 手数, 开仓价相对现价偏几个 tick)；现金压到维持率 = ratio
+    for sym, side, qty, ticks in holdings:
+        m = gs.market[sym]
+        spec = gs.specs[m.code]
+        gs.positions[(sym, side)] = Position(
+            symbol=sym, side=side, qty=qty, avg_open=m.last + ticks * spec.tick, mult=spec.mult, margin=0.0
+        )
+    gs._rebuild_exposure()
+    acc = gs._account_payload_base()
+    gs.cash = acc["margin_used"] * ratio - acc["unrealized_pnl"]
+    return gs
+
+
+def _summary(gs: GameState) -> tuple:
+    return gs.cash, gs.realized_pnl, gs.fees, {k: p.qty for k, p in gs.positions.items()}
+
+
+def _assert_same(gs: GameState) -> tuple:
+    a, b = gs, copy.deepcopy(gs)
+    liquidate_stepwise(a, a.call_ratio)
+    liquidate_planned(b, b.call_ratio)
+    sa, sb = _summary(a), _summary(b)
+    for x, y in zip(sa[:3], sb[:3]):
+        assert math.isclose(x, y, rel_tol=1e-9, abs_tol=1e-6), (sa, sb)
+    assert sa[3] == sb[3]
+    return sb
+
+
+def test_partial_liquidation_matches_loop() -> None:
+    gs = GameState(frontend_dir=FRONTEND_DIR, seed=11)
+    a, b, c = list(gs.market)[:3]
+    holdings = [(a, "long", 40, -3), (b, "short", 25, 5), (c, "long", 10, 0)]
+    remaining = _assert_same(_account(gs, holdings, 1.05))[3]
+    # 只差一点到追加线：平掉一部分就够了，仓位还在
+    before = {(sym, side): qty for sym, side, qty, _ in holdings}
+    assert remaining and sum(remaining.values()) < sum(before.values())
+    assert any(0 < q < before[k] for k, q in remaining.items())
+
+
+def test_limit_locked_market_matches_loop() -> None:
+    gs = GameState(frontend_dir=FRONTEND_DIR, seed=12)
+    holdings = []
+    for i, sym in enumerate(list(gs.market)[:4]):
+        m = gs.market[sym]
+        # 多头的合约封跌停、空头的封涨停：平仓价就是停板价
+        if i % 2 == 0:
+            m.last = m.limit_down
+            holdings.append((sym, "long", 8 + 3 * i, 5))
+        else:
+            m.last = m.limit_up
+            holdings.append((sym, "short", 8 + 3 * i, -5))
+    remaining = _assert_same(_account(gs, holdings, 0.7))[3]
+    assert sum(remaining.values()) < sum(qty for _, _, qty, _ in holdings)
+
+
+def test_many_positions_with_ties_match_loop() -> None:
+    rng = random.Random(13)
+    gs = GameState(frontend_dir=FRONTEND_DIR, seed=13)
+    # 同一货品的各月份开局现价一样，手数又只有几档，占用保证金会打平，比的是先后顺序
+    holdings = [
+        (sym, rng.choice(["long", "short"]), rng.choice([1, 5, 5, 12]), rng.randint(-10, 10)) for sym in gs.market
+    ]
+    for ratio in (0.3, 0.8, 1.02):
+        _assert_same(_account(copy.deepcopy(gs), holdings, ratio))
+
+
+if __name__ == "__main__":
+    test_partial_liquidation_matches_loop()
+    test_limit_locked_market_matches_loop()
+    test_many_positions_with_ties_match_loop()
+    print("ok")
@@ -0,0 +1,57 @@
+"""风控回归：GET /api/state（state_payload）只读，不改风控状态、不追加公告；
+风控状态在成交 / 每个 tick 里已经刷新过，读出来的和按当前维持率算的一致。
+
+pytest 或者直接跑（项目根目录）：
+    python -m tests.test_risk
+"""
+from __future__ import annotations
+
+from pathlib import Path
+
+from backend.engine.state import GameState
+
+FRONTEND_DIR = Path(__file__).resolve().parents[1] / "frontend"
+
+
+def _expected_state(gs: GameState, ratio: float) -> str:
+    if ratio >= gs.warn_ratio:
+        return "NORMAL"
+    if ratio >= gs.call_ratio:
+        return "WARN"
+    if ratio >= gs.liq_ratio:
+        return "CALL"
+    return "LIQ"
+
+
+def test_state_payload_is_read_only() -> None:
+    gs = GameState(frontend_dir=FRONTEND_DIR, seed=7)
+    gs.auto_liquidate = False
+    sym = next(iter(gs.market))
+    m = gs.market[sym]
+    spec = gs.specs[m.code]
+    # 开到维持率 1.15 左右（WARN 区间），之后行情一动就会在各档之间来回
+    qty = int(gs.cash / 1.15 / (m.last * spec.mult * spec.margin))
+    assert gs.place_order({"symbol": sym, "side": "buy", "effect": "open", "price": m.limit_up, "qty": qty})["ok"]
+
+    seen = set()
+    for _ in range(3 * gs.ticks_per_day):
+        gs.advance_tick()
+        marks = gs._change_marks()
+        log = list(gs.round_log)
+        acc = gs.state_payload()["account"]
+        assert gs._change_marks() == marks
+        assert list(gs.round_log) == log
+        assert acc["risk_state"] == _expected_state(gs, acc["margin_ratio"])
+        seen.add(acc["risk_state"])
+    assert len(seen) > 1, seen
+
+    # 就算状态是旧的，读也不去改它（改了既不标脏也不升版本号，缓存和 ETag 都不知道）
+    gs.risk_state, gs.risk_msg = "STALE", ""
+    marks = gs._change_marks()
+    assert gs.state_payload()["account"]["risk_state"] == "STALE"
+    assert gs._change_marks() == marks
+
+
+if __name__ == "__main__":
+    test_state_payload_is_read_only()
+    print("ok")